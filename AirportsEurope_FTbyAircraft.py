@@ -1,10 +1,29 @@
 from flask import Flask, render_template_string, request, jsonify
+import click
 import pandas as pd
+import numpy as np
 import math
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from datetime import datetime, timezone
+import hashlib
+import gzip
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+import threading
+import time
 import os
 
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se sirve gzip
+    brotli = None
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: solo hace falta para leer registros de vuelo en Parquet
+    pq = None
+
 app = Flask(__name__)
 
 # HTML TEMPLATE COMPLETO CORREGIDO
@@ -50,6 +69,18 @@ HTML_TEMPLATE = '''
         .dest-marker {
             filter: drop-shadow(0 0 8px #10b981);
         }
+        .airport-cluster {
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            border-radius: 50%;
+            background: rgba(59, 130, 246, 0.85);
+            border: 3px solid rgba(255, 255, 255, 0.9);
+            color: #ffffff;
+            font-weight: 700;
+            font-size: 12px;
+            cursor: pointer;
+        }
     </style>
 </head>
 <body class="bg-gray-50 min-h-screen">
@@ -109,6 +140,21 @@ HTML_TEMPLATE = '''
                         </select>
                     </div>
 
+                    <!-- Modelo de Viento -->
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-2">Modelo de Viento</label>
+                        <select id="windModelSelect" class="w-full p-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-blue-500 transition duration-200">
+                            <option value="surface" selected>Superficie (origen y destino)</option>
+                            <option value="route">En altura a lo largo de la ruta</option>
+                        </select>
+                    </div>
+
+                    <!-- Hora de Salida -->
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-2">Hora de Salida (opcional, usa la previsión horaria)</label>
+                        <input type="datetime-local" id="departureTimeInput" class="w-full p-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-blue-500 transition duration-200">
+                    </div>
+
                     <!-- Botón Calcular -->
                     <button id="calculateBtn" class="w-full bg-blue-600 hover:bg-blue-700 text-white font-bold py-3 px-4 rounded-lg transition duration-200 transform hover:scale-105 flex items-center justify-center">
                         <span id="calculateText">🧮 Calcular Duración del Vuelo</span>
@@ -164,12 +210,15 @@ HTML_TEMPLATE = '''
         let originMarker = null;
         let destMarker = null;
         let flightLine = null;
+        let airportMarkers = null;
+        let visibleRequestId = 0;
 
         // Inicialización
         document.addEventListener('DOMContentLoaded', function() {
             console.log('🚀 Inicializando aplicación...');
             initializeMap();
             loadAirports();
+            loadAircraftTypes();
             setupEventListeners();
         });
 
@@ -182,6 +231,10 @@ HTML_TEMPLATE = '''
                 attribution: '© OpenStreetMap contributors'
             }).addTo(map);
 
+            airportMarkers = L.layerGroup().addTo(map);
+            map.on('click', showNearestAirport);
+            map.on('moveend', loadVisibleAirports);
+
             console.log('✅ Mapa inicializado');
         }
 
@@ -191,16 +244,24 @@ HTML_TEMPLATE = '''
                 console.log('📡 Cargando aeropuertos...');
                 showLoading('Cargando aeropuertos...');
 
-                const response = await fetch('/api/airports');
-                if (!response.ok) {
-                    throw new Error(`HTTP error! status: ${response.status}`);
-                }
+                // Lista completa en formato compacto (columnas + filas) para los selects
+                const fields = 'iata_code,name,iso_country,latitude_deg,longitude_deg';
+                airports = [];
+                let cursor = '';
+                do {
+                    const response = await fetch(`/api/airports?fields=${fields}&format=compact&limit=5000&cursor=${cursor}`);
+                    if (!response.ok) {
+                        throw new Error(`HTTP error! status: ${response.status}`);
+                    }
 
-                airports = await response.json();
+                    const page = await response.json();
+                    airports.push(...decodeCompact(page));
+                    cursor = page.next_cursor || '';
+                } while (cursor);
                 console.log(`✅ Cargados ${airports.length} aeropuertos`);
 
                 populateSelects();
-                addAirportsToMap();
+                loadVisibleAirports();
                 hideLoading();
 
             } catch (error) {
@@ -210,6 +271,49 @@ HTML_TEMPLATE = '''
             }
         }
 
+        // Cargar el catálogo de aeronaves en el select de tipo de avión
+        async function loadAircraftTypes() {
+            try {
+                const response = await fetch('/api/aircraft');
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+
+                const catalogue = await response.json();
+                const select = document.getElementById('aircraftTypeSelect');
+                const selected = select.value;
+                const labels = {
+                    generic: 'Genérico',
+                    turboprop: 'Turbohélice',
+                    regional: 'Regional',
+                    narrowbody: 'Fuselaje estrecho',
+                    widebody: 'Fuselaje ancho'
+                };
+                const groups = {};
+
+                select.innerHTML = '';
+                catalogue.aircraft.forEach(aircraft => {
+                    if (!groups[aircraft.category]) {
+                        groups[aircraft.category] = document.createElement('optgroup');
+                        groups[aircraft.category].label = labels[aircraft.category] || aircraft.category;
+                        select.appendChild(groups[aircraft.category]);
+                    }
+                    const option = document.createElement('option');
+                    option.value = aircraft.icao_type;
+                    option.textContent = aircraft.category === 'generic'
+                        ? aircraft.name
+                        : `${aircraft.icao_type} - ${aircraft.name} (${aircraft.cruise_speed_kmh} km/h)`;
+                    groups[aircraft.category].appendChild(option);
+                });
+                select.value = selected;
+                console.log(`✅ Cargados ${catalogue.aircraft.length} tipos de avión`);
+
+            } catch (error) {
+                // Se mantienen las opciones genéricas del HTML
+                console.error('❌ Error cargando tipos de avión:', error);
+            }
+        }
+
         // Poblar selects de aeropuertos
         function populateSelects() {
             console.log('📝 Poblando selects...');
@@ -236,19 +340,9 @@ HTML_TEMPLATE = '''
             console.log('✅ Selects poblados');
         }
 
-        // Añadir aeropuertos al mapa
-        function addAirportsToMap() {
-            console.log('📍 Añadiendo aeropuertos al mapa...');
-            airports.forEach(airport => {
-                const marker = L.marker([airport.latitude_deg, airport.longitude_deg], {
-                    icon: L.divIcon({
-                        className: 'airport-marker',
-                        html: '✈️',
-                        iconSize: [25, 25],
-                        iconAnchor: [12, 12]
-                    })
-                })
-                .bindPopup(`
+        // Contenido del popup de un aeropuerto
+        function airportPopupHtml(airport) {
+            return `
                     <div class="text-center min-w-48">
                         <div class="font-bold text-lg text-blue-600">${airport.iata_code}</div>
                         <div class="text-sm text-gray-700">${airport.name}</div>
@@ -264,10 +358,108 @@ HTML_TEMPLATE = '''
                             </button>
                         </div>
                     </div>
-                `)
-                .addTo(map);
+                `;
+        }
+
+        // Convertir una respuesta compacta ({fields, rows}) en objetos
+        function decodeCompact(page) {
+            return page.rows.map(row => {
+                const airport = {};
+                page.fields.forEach((field, i) => airport[field] = row[i]);
+                return airport;
             });
-            console.log('✅ Aeropuertos añadidos al mapa');
+        }
+
+        // Cargar los grupos de aeropuertos de las teselas visibles (agrupados en el servidor)
+        async function loadVisibleAirports() {
+            if (!map || !airportMarkers) return;
+            const requestId = ++visibleRequestId;
+            const zoom = map.getZoom();
+            const tilesPerSide = Math.pow(2, zoom);
+            const pixelBounds = map.getPixelBounds();
+            const minX = Math.max(0, Math.floor(pixelBounds.min.x / 256));
+            const maxX = Math.min(tilesPerSide - 1, Math.floor(pixelBounds.max.x / 256));
+            const minY = Math.max(0, Math.floor(pixelBounds.min.y / 256));
+            const maxY = Math.min(tilesPerSide - 1, Math.floor(pixelBounds.max.y / 256));
+
+            const requests = [];
+            for (let x = minX; x <= maxX; x++) {
+                for (let y = minY; y <= maxY; y++) {
+                    requests.push(fetch(`/api/airports/clusters/${zoom}/${x}/${y}`).then(response => {
+                        if (!response.ok) {
+                            throw new Error(`HTTP error! status: ${response.status}`);
+                        }
+                        return response.json();
+                    }));
+                }
+            }
+
+            try {
+                const tiles = await Promise.all(requests);
+                // Ignorar respuestas de movimientos del mapa ya superados
+                if (requestId === visibleRequestId) {
+                    addAirportsToMap(tiles.flat());
+                }
+            } catch (error) {
+                console.error('❌ Error cargando aeropuertos visibles:', error);
+            }
+        }
+
+        // Añadir aeropuertos y grupos al mapa
+        function addAirportsToMap(clusters) {
+            airportMarkers.clearLayers();
+            clusters.forEach(cluster => {
+                if (cluster.count === 1) {
+                    L.marker([cluster.latitude_deg, cluster.longitude_deg], {
+                        icon: L.divIcon({
+                            className: 'airport-marker',
+                            html: '✈️',
+                            iconSize: [25, 25],
+                            iconAnchor: [12, 12]
+                        })
+                    })
+                    .bindPopup(airportPopupHtml(cluster))
+                    .addTo(airportMarkers);
+                    return;
+                }
+
+                const size = Math.min(56, 26 + Math.round(Math.log10(cluster.count) * 12));
+                L.marker([cluster.latitude_deg, cluster.longitude_deg], {
+                    icon: L.divIcon({
+                        className: '',
+                        html: `<div class="airport-cluster" style="width:${size}px;height:${size}px">${cluster.count}</div>`,
+                        iconSize: [size, size],
+                        iconAnchor: [size / 2, size / 2]
+                    })
+                })
+                .on('click', () => {
+                    const [south, west, north, east] = cluster.bounds;
+                    map.fitBounds([[south, west], [north, east]], { padding: [40, 40] });
+                })
+                .addTo(airportMarkers);
+            });
+        }
+
+        // Mostrar el aeropuerto más cercano al punto del mapa pulsado
+        async function showNearestAirport(event) {
+            try {
+                const response = await fetch(`/api/airports/nearest?lat=${event.latlng.lat}&lon=${event.latlng.lng}&k=1`);
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+
+                const nearest = await response.json();
+                if (nearest.length === 0) return;
+
+                const airport = nearest[0];
+                L.popup()
+                    .setLatLng([airport.latitude_deg, airport.longitude_deg])
+                    .setContent(airportPopupHtml(airport) +
+                        `<div class="text-xs text-gray-500 text-center mt-1">📍 A ${airport.distance_km} km del punto seleccionado</div>`)
+                    .openOn(map);
+            } catch (error) {
+                console.error('❌ Error buscando el aeropuerto más cercano:', error);
+            }
         }
 
         // Configurar event listeners
@@ -508,6 +700,8 @@ HTML_TEMPLATE = '''
             const originIata = originSelect.value;
             const destIata = destSelect.value;
             const aircraftType = aircraftTypeSelect.value;
+            const windModel = document.getElementById('windModelSelect').value;
+            const departureValue = document.getElementById('departureTimeInput').value;
 
             if (!originIata || !destIata) {
                 alert('Por favor selecciona aeropuertos de origen y destino');
@@ -523,16 +717,23 @@ HTML_TEMPLATE = '''
                 console.log(`✈️ Calculando vuelo: ${originIata} → ${destIata}`);
                 showLoading('Calculando duración...');
 
+                const payload = {
+                    origin: originIata,
+                    destination: destIata,
+                    aircraft_type: aircraftType,
+                    wind_model: windModel
+                };
+                if (departureValue) {
+                    // La hora local del navegador se envía en UTC
+                    payload.departure_time = new Date(departureValue).toISOString();
+                }
+
                 const response = await fetch('/api/calculate', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
                     },
-                    body: JSON.stringify({
-                        origin: originIata,
-                        destination: destIata,
-                        aircraft_type: aircraftType
-                    })
+                    body: JSON.stringify(payload)
                 });
 
                 if (!response.ok) {
@@ -569,6 +770,15 @@ HTML_TEMPLATE = '''
             const hours = Math.floor(result.duration_min / 60);
             const minutes = Math.round(result.duration_min % 60);
             const durationText = hours > 0 ? `${hours}h ${minutes}m` : `${minutes}m`;
+            const routeText = result.route
+                ? `🌀 Viento en ruta (${result.route.wind_level}): ${result.route.avg_tailwind_kmh > 0 ? '+' : ''}${result.route.avg_tailwind_kmh} km/h de media en ${result.route.segments} tramos`
+                : '🌬️ Viento de superficie en origen y destino';
+            const defaultWeatherText = result.weather_source === 'default'
+                ? '<div class="text-xs text-orange-600 mt-1">⚠️ Clima no disponible: se han usado valores por defecto</div>'
+                : '';
+            const departureText = result.departure_time
+                ? `<div class="text-xs text-gray-600 mt-1">🕒 Salida ${new Date(result.departure_time).toLocaleString()} · llegada ${new Date(result.arrival_time).toLocaleString()} (${result.weather_source === 'forecast' ? 'previsión horaria' : 'sin previsión, clima actual'})</div>`
+                : '';
 
             resultContent.innerHTML = `
                 <div class="grid grid-cols-1 md:grid-cols-2 gap-4">
@@ -606,6 +816,9 @@ HTML_TEMPLATE = '''
                             <div class="text-2xl font-bold text-purple-600">${durationText}</div>
                         </div>
                     </div>
+                    <div class="text-xs text-gray-600 mt-2">${routeText}</div>
+                    ${departureText}
+                    ${defaultWeatherText}
                 </div>
             `;
 
@@ -621,47 +834,224 @@ HTML_TEMPLATE = '''
 '''
 
 
-def download_airport_data():
-    """Descargar datos de aeropuertos europeos desde la web"""
+# Sesión HTTP compartida (conexiones keep-alive reutilizables)
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 16))  # conexiones por host
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 2))
+HTTP_BACKOFF = float(os.environ.get('HTTP_BACKOFF', 0.3))  # segundos
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))  # segundos
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))  # segundos
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+
+def create_http_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+    """Crear una sesión con pool de conexiones y reintentos con backoff en 5xx/timeouts"""
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD'])
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry, pool_block=False)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+http_session = create_http_session()
+# Sesión sin reintentos para las consultas dentro de una petición (las acota el tiempo límite)
+request_http_session = create_http_session(retries=0)
+
+
+# Dataset público de aeropuertos (OurAirports) y caché local en disco
+AIRPORTS_URL = "https://raw.githubusercontent.com/davidmegginson/ourairports-data/main/airports.csv"
+AIRPORTS_CACHE_PATH = os.environ.get('AIRPORTS_CACHE_PATH', 'airports_cache.pkl')
+# 'check': petición condicional (ETag) al arrancar; 'never': usar la caché sin consultar la red
+AIRPORTS_CACHE_REFRESH = os.environ.get('AIRPORTS_CACHE_REFRESH', 'check')
+AIRPORTS_CACHE_VERSION = 2  # cambiar si cambia el filtrado para invalidar las cachés existentes
+
+
+def read_airport_cache(path=AIRPORTS_CACHE_PATH):
+    """Leer la tabla de aeropuertos cacheada en disco (None si no existe o no es válida)"""
     try:
-        print("🌍 Descargando datos de aeropuertos europeos...")
-
-        # Dataset público de aeropuertos (OurAirports)
-        url = "https://raw.githubusercontent.com/davidmegginson/ourairports-data/main/airports.csv"
-
-        # Descargar todos los aeropuertos
-        all_airports = pd.read_csv(url)
-
-        # Filtrar aeropuertos europeos principales
-        europe_countries = ['ES', 'FR', 'DE', 'GB', 'IT', 'NL', 'CH', 'BE', 'PT', 'SE',
-                            'NO', 'DK', 'FI', 'IE', 'AT', 'PL', 'CZ', 'HU', 'GR', 'TR']
-
-        europe_airports = all_airports[
-            (all_airports['iso_country'].isin(europe_countries)) &
-            (all_airports['type'].isin(['medium_airport', 'large_airport'])) &
-            (all_airports['iata_code'].notna()) &
-            (all_airports['scheduled_service'] == 'yes')
-            ].copy()
+        cached = pd.read_pickle(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Caché de aeropuertos no válida ({path}): {e}")
+        return None
+
+    if not isinstance(cached, dict) or cached.get('version') != AIRPORTS_CACHE_VERSION:
+        return None
+    if cached.get('filters') != airport_filters():
+        print("⚠️ Los filtros de aeropuertos han cambiado, se ignora la caché")
+        return None
+    return cached
+
+
+def write_airport_cache(df, etag=None, last_modified=None, path=AIRPORTS_CACHE_PATH):
+    """Guardar la tabla filtrada en disco de forma atómica junto con su sello de versión"""
+    cached = {
+        'version': AIRPORTS_CACHE_VERSION,
+        'filters': airport_filters(),
+        'etag': etag,
+        'last_modified': last_modified,
+        'fetched_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'df': df
+    }
+    tmp_path = f"{path}.tmp"
+    try:
+        pd.to_pickle(cached, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar la caché de aeropuertos ({path}): {e}")
+    return cached
 
-        # Ordenar por importancia y tomar los 50 principales
-        europe_airports['priority'] = europe_airports['type'].map({
-            'large_airport': 1,
-            'medium_airport': 2
-        })
 
-        top_airports = europe_airports.sort_values(['priority', 'iata_code']).head(50)
+def load_airport_data(force_refresh=False):
+    """Cargar aeropuertos desde la caché local y descargarlos solo si el origen ha cambiado
 
-        # Seleccionar y renombrar columnas necesarias
-        top_airports = top_airports[['iata_code', 'name', 'latitude_deg', 'longitude_deg', 'iso_country']]
-        top_airports = top_airports.rename(columns={'iata_code': 'iata_code'})
+    Devuelve (DataFrame, origen) donde origen es 'cache', 'download' o 'fallback'.
+    """
+    cached = None if force_refresh else read_airport_cache()
+    if cached is not None and AIRPORTS_CACHE_REFRESH == 'never':
+        print(f"💾 Aeropuertos cargados desde caché ({len(cached['df'])})")
+        return cached['df'], 'cache'
 
+    try:
+        headers = {}
+        if cached is not None and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        elif cached is not None and cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        response = http_session.get(AIRPORTS_URL, headers=headers, timeout=HTTP_TIMEOUT, stream=True)
+        if response.status_code == 304 and cached is not None:
+            response.close()
+            print(f"💾 Aeropuertos sin cambios, cargados desde caché ({len(cached['df'])})")
+            return cached['df'], 'cache'
+        response.raise_for_status()
+
+        # El CSV se parsea directamente del flujo de red, sin guardar los ~12 MB en memoria
+        print("🌍 Descargando datos de aeropuertos europeos...")
+        response.raw.decode_content = True
+        top_airports = filter_airports(read_airports_csv(response.raw))
+        write_airport_cache(top_airports, response.headers.get('ETag'),
+                            response.headers.get('Last-Modified'))
         print(f"✅ Descargados {len(top_airports)} aeropuertos europeos")
-        return top_airports
+        return top_airports, 'download'
 
     except Exception as e:
+        if cached is not None:
+            print(f"⚠️ No se pudo comprobar el origen ({e}), usando caché ({len(cached['df'])})")
+            return cached['df'], 'cache'
         print(f"❌ Error descargando aeropuertos: {e}")
-        # Datos de respaldo en caso de error
-        return create_fallback_data()
+        return create_fallback_data(), 'fallback'
+
+
+# Columnas y tipos que se leen del CSV de OurAirports (el resto se descarta al parsear)
+AIRPORT_CSV_COLUMNS = ['iata_code', 'icao_code', 'gps_code', 'name', 'latitude_deg',
+                       'longitude_deg', 'continent', 'iso_country', 'type', 'scheduled_service']
+AIRPORT_CSV_DTYPES = {
+    'iata_code': 'object',
+    'icao_code': 'object',
+    'gps_code': 'object',
+    'name': 'object',
+    'latitude_deg': 'float64',
+    'longitude_deg': 'float64',
+    'continent': 'category',
+    'iso_country': 'category',
+    'type': 'category',
+    'scheduled_service': 'category'
+}
+AIRPORT_CSV_CHUNKSIZE = int(os.environ.get('AIRPORT_CSV_CHUNKSIZE', 20000))  # filas por bloque
+
+
+def env_list(name, default):
+    """Lista separada por comas desde una variable de entorno (vacía = sin filtro)"""
+    value = os.environ.get(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+# Filtros del universo de aeropuertos (configurables con variables de entorno)
+EUROPE_COUNTRIES = ['ES', 'FR', 'DE', 'GB', 'IT', 'NL', 'CH', 'BE', 'PT', 'SE',
+                    'NO', 'DK', 'FI', 'IE', 'AT', 'PL', 'CZ', 'HU', 'GR', 'TR']
+AIRPORT_COUNTRIES = env_list('AIRPORT_COUNTRIES', EUROPE_COUNTRIES)
+AIRPORT_CONTINENTS = env_list('AIRPORT_CONTINENTS', [])  # p. ej. 'EU' para toda Europa
+AIRPORT_TYPES = env_list('AIRPORT_TYPES', ['medium_airport', 'large_airport'])
+AIRPORT_SCHEDULED_ONLY = os.environ.get('AIRPORT_SCHEDULED_ONLY', '1') == '1'
+AIRPORT_LIMIT = int(os.environ.get('AIRPORT_LIMIT', 50))  # 0 = sin límite
+
+
+def airport_filters():
+    """Filtros activos; se guardan con la caché para invalidarla si cambian"""
+    return {
+        'countries': sorted(AIRPORT_COUNTRIES),
+        'continents': sorted(AIRPORT_CONTINENTS),
+        'types': sorted(AIRPORT_TYPES),
+        'scheduled_only': AIRPORT_SCHEDULED_ONLY,
+        'limit': AIRPORT_LIMIT
+    }
+
+
+def read_airports_csv(source, chunksize=AIRPORT_CSV_CHUNKSIZE):
+    """Leer el CSV por bloques con columnas y tipos reducidos, filtrando filas al vuelo"""
+    # "NA" es un valor válido (continente North America, país Namibia): solo el vacío es nulo
+    chunks = pd.read_csv(source, usecols=lambda column: column in AIRPORT_CSV_COLUMNS,
+                         dtype=AIRPORT_CSV_DTYPES, chunksize=chunksize,
+                         keep_default_na=False, na_values=[''])
+    selected = [select_airport_rows(chunk) for chunk in chunks]
+    if not selected:
+        return pd.DataFrame(columns=AIRPORT_CSV_COLUMNS)
+
+    # Las categorías de cada bloque son distintas: se normalizan a texto tras unirlos
+    airports = pd.concat(selected, ignore_index=True)
+    for column in ('continent', 'iso_country', 'type', 'scheduled_service'):
+        if column in airports:
+            airports[column] = airports[column].astype(object)
+    return airports
+
+
+def select_airport_rows(airports):
+    """Filas de aeropuertos que cumplen los filtros configurados y tienen código IATA"""
+    mask = airports['iata_code'].notna()
+    if AIRPORT_COUNTRIES:
+        mask &= airports['iso_country'].isin(AIRPORT_COUNTRIES)
+    if AIRPORT_CONTINENTS:
+        mask &= airports['continent'].isin(AIRPORT_CONTINENTS)
+    if AIRPORT_TYPES:
+        mask &= airports['type'].isin(AIRPORT_TYPES)
+    if AIRPORT_SCHEDULED_ONLY:
+        mask &= airports['scheduled_service'] == 'yes'
+    return airports[mask]
+
+
+def filter_airports(all_airports):
+    """Filtrar los aeropuertos configurados y quedarse con las columnas necesarias"""
+    europe_airports = select_airport_rows(all_airports).copy()
+
+    # Ordenar por importancia y aplicar el límite configurado
+    europe_airports['priority'] = europe_airports['type'].map({
+        'large_airport': 1,
+        'medium_airport': 2
+    }).fillna(3)
+
+    top_airports = europe_airports.sort_values(['priority', 'iata_code'])
+    if AIRPORT_LIMIT > 0:
+        top_airports = top_airports.head(AIRPORT_LIMIT)
+
+    # Seleccionar columnas necesarias
+    top_airports['icao_code'] = top_airports['icao_code'].fillna(top_airports['gps_code'])
+    top_airports = top_airports[['iata_code', 'icao_code', 'name', 'latitude_deg', 'longitude_deg',
+                                 'iso_country', 'type']]
+
+    return top_airports
 
 
 def create_fallback_data():
@@ -672,6 +1062,11 @@ def create_fallback_data():
                       'HEL', 'DUB', 'LIS', 'OPO', 'AGP', 'PMI', 'VLC', 'SVQ', 'NCE', 'MRS',
                       'TLS', 'BOD', 'LIL', 'HAM', 'STR', 'CGN', 'DUS', 'BER', 'MAN', 'EDI',
                       'BHX', 'GLA', 'BLQ', 'VCE', 'NAP', 'GVA', 'BSL', 'OTP', 'SOF', 'KRK'],
+        'icao_code': ['LEMD', 'LEBL', 'LFPG', 'LFPO', 'EDDF', 'EDDM', 'EGLL', 'EGKK', 'EHAM', 'LIRF',
+                      'LIML', 'LSZH', 'EBBR', 'LOWW', 'LKPR', 'LHBP', 'EPWA', 'ESSA', 'EKCH', 'ENGM',
+                      'EFHK', 'EIDW', 'LPPT', 'LPPR', 'LEMG', 'LEPA', 'LEVC', 'LEZL', 'LFMN', 'LFML',
+                      'LFBO', 'LFBD', 'LFQQ', 'EDDH', 'EDDS', 'EDDK', 'EDDL', 'EDDB', 'EGCC', 'EGPH',
+                      'EGBB', 'EGPF', 'LIPE', 'LIPZ', 'LIRN', 'LSGG', 'LFSB', 'LROP', 'LBSF', 'EPKK'],
         'name': [
             'Adolfo Suárez Madrid–Barajas Airport', 'Barcelona-El Prat Airport',
             'Charles de Gaulle Airport', 'Paris-Orly Airport', 'Frankfurt Airport',
@@ -720,45 +1115,632 @@ def create_fallback_data():
     return pd.DataFrame(fallback_data)
 
 
-# Cargar datos de aeropuertos (se descargan una vez al iniciar la app)
-airports_df = download_airport_data()
+def build_airport_index(df):
+    """Construir índices IATA/ICAO -> registro del aeropuerto (una sola vez al cargar)
+
+    Devuelve (registros por fila, índice IATA, índice ICAO).
+    """
+    records = []
+    airports_by_iata = {}
+    airports_by_icao = {}
+    for record in df.to_dict('records'):
+        # Registros ligeros (dict) sin NaN para poder serializarlos directamente
+        record = {key: (None if isinstance(value, float) and math.isnan(value) else value)
+                  for key, value in record.items()}
+        records.append(record)
+        iata_code = record.get('iata_code')
+        icao_code = record.get('icao_code')
+        if iata_code and iata_code not in airports_by_iata:
+            airports_by_iata[iata_code] = record
+        if icao_code and icao_code not in airports_by_icao:
+            airports_by_icao[icao_code] = record
+    return records, airports_by_iata, airports_by_icao
+
+
+EARTH_RADIUS_KM = 6371.0
+DISTANCE_MATRIX_MAX_AIRPORTS = int(os.environ.get('DISTANCE_MATRIX_MAX_AIRPORTS', 1500))
+DISTANCE_ROW_CACHE_SIZE = int(os.environ.get('DISTANCE_ROW_CACHE_SIZE', 256))
+
+
+def haversine_distance_array(lat1, lon1, lat2, lon2):
+    """Distancia gran círculo entre coordenadas (grados -> km, admite broadcasting)"""
+    lat1_rad = np.radians(lat1)
+    lon1_rad = np.radians(lon1)
+    lat2_rad = np.radians(lat2)
+    lon2_rad = np.radians(lon2)
+
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+class DistanceMatrix:
+    """Distancias gran círculo entre todos los aeropuertos, calculadas una vez y memorizadas
+
+    Si hay pocos aeropuertos se calcula la matriz NxN completa; con tablas grandes
+    se calculan filas bajo demanda (O(N) vectorizado) y se guardan en una caché LRU.
+    """
+
+    def __init__(self, df, max_full_airports=DISTANCE_MATRIX_MAX_AIRPORTS,
+                 row_cache_size=DISTANCE_ROW_CACHE_SIZE):
+        self.codes = df['iata_code'].tolist()
+        self.position = {}
+        for i, code in enumerate(self.codes):
+            self.position.setdefault(code, i)
+        self.lat = df['latitude_deg'].to_numpy(dtype=np.float64)
+        self.lon = df['longitude_deg'].to_numpy(dtype=np.float64)
+        self.max_full_airports = max_full_airports
+        self.row_cache_size = row_cache_size
+        self._matrix = None
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def matrix(self):
+        """Matriz NxN completa (None si la tabla es demasiado grande)"""
+        if self._matrix is None and len(self) <= self.max_full_airports:
+            with self._lock:
+                if self._matrix is None:
+                    self._matrix = haversine_distance_array(
+                        self.lat[:, None], self.lon[:, None],
+                        self.lat[None, :], self.lon[None, :])
+        return self._matrix
+
+    def row(self, i):
+        """Distancias desde el aeropuerto i a todos los demás"""
+        matrix = self.matrix()
+        if matrix is not None:
+            return matrix[i]
+        with self._lock:
+            row = self._rows.get(i)
+            if row is not None:
+                self._rows.move_to_end(i)
+                return row
+        row = haversine_distance_array(self.lat[i], self.lon[i], self.lat, self.lon)
+        with self._lock:
+            self._rows[i] = row
+            while len(self._rows) > self.row_cache_size:
+                self._rows.popitem(last=False)
+        return row
+
+    def indices(self, codes):
+        """Posiciones en la matriz de una lista de códigos IATA (-1 si no existen)"""
+        return np.array([self.position.get(code, -1) for code in codes], dtype=np.int64)
+
+    def distance(self, origin_iata, dest_iata):
+        """Distancia en km entre dos códigos IATA (None si alguno no existe)"""
+        i = self.position.get(origin_iata)
+        j = self.position.get(dest_iata)
+        if i is None or j is None:
+            return None
+        return float(self.row(i)[j])
+
+    def pair_distances(self, origin_idx, dest_idx):
+        """Distancias de muchos pares a la vez a partir de sus posiciones"""
+        matrix = self.matrix()
+        if matrix is not None:
+            return matrix[origin_idx, dest_idx]
+        return haversine_distance_array(self.lat[origin_idx], self.lon[origin_idx],
+                                        self.lat[dest_idx], self.lon[dest_idx])
+
+
+def unit_vectors(lat, lon):
+    """Coordenadas en grados -> vectores unitarios (x, y, z) sobre la esfera"""
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+    cos_lat = np.cos(lat_rad)
+    return np.stack([cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)], axis=-1)
+
+
+class SpatialIndex:
+    """Índice espacial para búsquedas por radio y de aeropuerto más cercano
+
+    Los aeropuertos se ordenan por latitud: una búsqueda binaria acota la franja
+    candidata y la distancia exacta se calcula de forma vectorizada con la cuerda
+    entre vectores unitarios.
+    """
+
+    def __init__(self, lat, lon):
+        self.order = np.argsort(lat, kind='stable')
+        self.lat_sorted = np.asarray(lat, dtype=np.float64)[self.order]
+        self.xyz = unit_vectors(self.lat_sorted, np.asarray(lon, dtype=np.float64)[self.order])
+
+    def __len__(self):
+        return len(self.order)
+
+    def within(self, lat, lon, radius_km):
+        """Posiciones (en el DataFrame) y distancias de los aeropuertos a menos de radius_km"""
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        lo = np.searchsorted(self.lat_sorted, lat - dlat, side='left')
+        hi = np.searchsorted(self.lat_sorted, lat + dlat, side='right')
+
+        point = unit_vectors(lat, lon)
+        chord = np.linalg.norm(self.xyz[lo:hi] - point, axis=1)
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+
+        inside = np.flatnonzero(distances <= radius_km)
+        nearest_first = inside[np.argsort(distances[inside], kind='stable')]
+        return self.order[lo + nearest_first], distances[nearest_first]
+
+    def nearest(self, lat, lon, k=1):
+        """Las k posiciones más cercanas al punto, ampliando el radio hasta encontrarlas"""
+        k = min(k, len(self))
+        radius_km = 100.0
+        while True:
+            positions, distances = self.within(lat, lon, radius_km)
+            if len(positions) >= k or radius_km >= math.pi * EARTH_RADIUS_KM:
+                return positions[:k], distances[:k]
+            radius_km *= 4
+
+
+# Zoom mínimo del mapa a partir del cual se muestra cada tipo de aeropuerto
+AIRPORT_MIN_ZOOM = {
+    'large_airport': 0,
+    'medium_airport': 6,
+    'small_airport': 8
+}
+DEFAULT_MIN_ZOOM = 9
+PAYLOAD_CACHE_SIZE = int(os.environ.get('PAYLOAD_CACHE_SIZE', 256))  # respuestas por dataset
+
+
+PAYLOAD_COMPRESS_MIN_SIZE = 1024  # bytes; por debajo no compensa comprimir
+
+
+class Payload:
+    """Respuesta ya serializada con sus variantes comprimidas (gzip/brotli) y ETags fuertes"""
+
+    def __init__(self, body, mimetype='application/json'):
+        self.body = body if isinstance(body, bytes) else body.encode('utf-8')
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(self.body).hexdigest()
+
+        # Las variantes se comprimen una sola vez, al construir la respuesta
+        self.encoded = {}
+        if len(self.body) >= PAYLOAD_COMPRESS_MIN_SIZE:
+            self.encoded['gzip'] = gzip.compress(self.body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.encoded['br'] = brotli.compress(self.body, quality=11)
+
+    def variant(self, accept_encodings):
+        """Elegir (codificación, cuerpo, ETag) según la cabecera Accept-Encoding"""
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encoded and accept_encodings[encoding]:
+                return encoding, self.encoded[encoding], f"{self.etag}-{encoding}"
+        return None, self.body, self.etag
+
+
+class PayloadCache:
+    """Caché LRU de respuestas pre-serializadas"""
+
+    def __init__(self, max_size=PAYLOAD_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """Devuelve la respuesta cacheada o la construye con build() una sola vez"""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                return payload
+
+        payload = build()
+        with self._lock:
+            self._entries[key] = payload
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return payload
+
+
+# Agrupación de marcadores en el servidor (rejilla en píxeles Web Mercator)
+CLUSTER_CELL_PX = 64  # divide a 256: ningún grupo cruza el borde de una tesela
+CLUSTER_MAX_ZOOM = 18
+TILE_SIZE_PX = 256
+
+
+def mercator_pixels(lat, lon, zoom):
+    """Coordenadas en grados -> píxeles globales Web Mercator a un nivel de zoom"""
+    world_px = TILE_SIZE_PX * 2 ** zoom
+    lat = np.clip(lat, -85.05112878, 85.05112878)
+    x = (np.asarray(lon) + 180.0) / 360.0 * world_px
+    sin_lat = np.sin(np.radians(lat))
+    y = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * world_px
+    return np.clip(x, 0, world_px - 1), np.clip(y, 0, world_px - 1)
+
+
+class ClusterLevel:
+    """Grupos de aeropuertos precalculados para un nivel de zoom, ordenados por tesela"""
+
+    def __init__(self, records, lat, lon, zoom):
+        self.zoom = zoom
+        x, y = mercator_pixels(lat, lon, zoom)
+        cells_per_side = TILE_SIZE_PX * 2 ** zoom // CLUSTER_CELL_PX
+        cell_x = (x // CLUSTER_CELL_PX).astype(np.int64)
+        cell_y = (y // CLUSTER_CELL_PX).astype(np.int64)
+        cell_keys = cell_x * cells_per_side + cell_y
+
+        cells, labels, counts = np.unique(cell_keys, return_inverse=True, return_counts=True)
+        self.count = counts
+        self.lat = np.bincount(labels, weights=lat, minlength=len(cells)) / counts
+        self.lon = np.bincount(labels, weights=lon, minlength=len(cells)) / counts
+        self.south = np.full(len(cells), np.inf)
+        self.west = np.full(len(cells), np.inf)
+        self.north = np.full(len(cells), -np.inf)
+        self.east = np.full(len(cells), -np.inf)
+        np.minimum.at(self.south, labels, lat)
+        np.minimum.at(self.west, labels, lon)
+        np.maximum.at(self.north, labels, lat)
+        np.maximum.at(self.east, labels, lon)
+
+        # Representante de cada grupo (el propio aeropuerto si está solo)
+        self.first = np.full(len(cells), -1, dtype=np.int64)
+        self.first[labels[::-1]] = np.arange(len(labels))[::-1]
+        self.records = records
+
+        # Tesela de cada grupo; ordenados por tesela para responder con un rango
+        cells_per_tile = TILE_SIZE_PX // CLUSTER_CELL_PX
+        tiles_per_side = 2 ** zoom
+        tile_keys = (cells // cells_per_side // cells_per_tile) * tiles_per_side + \
+                    (cells % cells_per_side // cells_per_tile)
+        self.order = np.argsort(tile_keys, kind='stable')
+        self.tile_keys = tile_keys[self.order]
+
+    def tile(self, x, y):
+        """Grupos de una tesela z/x/y listos para serializar"""
+        key = x * 2 ** self.zoom + y
+        lo = np.searchsorted(self.tile_keys, key, side='left')
+        hi = np.searchsorted(self.tile_keys, key, side='right')
+
+        clusters = []
+        for i in self.order[lo:hi].tolist():
+            if self.count[i] == 1:
+                record = self.records[self.first[i]]
+                clusters.append({
+                    'count': 1,
+                    'iata_code': record['iata_code'],
+                    'name': record['name'],
+                    'iso_country': record['iso_country'],
+                    'latitude_deg': record['latitude_deg'],
+                    'longitude_deg': record['longitude_deg']
+                })
+            else:
+                clusters.append({
+                    'count': int(self.count[i]),
+                    'latitude_deg': round(float(self.lat[i]), 5),
+                    'longitude_deg': round(float(self.lon[i]), 5),
+                    'bounds': [round(float(self.south[i]), 5), round(float(self.west[i]), 5),
+                               round(float(self.north[i]), 5), round(float(self.east[i]), 5)]
+                })
+        return clusters
+
+
+class AirportDataset:
+    """Tabla de aeropuertos activa junto con todas sus estructuras derivadas
+
+    Se construye completa antes de publicarse, así que sustituirla es un simple
+    cambio de referencia y cada petición trabaja con una instantánea coherente.
+    """
+
+    def __init__(self, df, source):
+        self.df = df.reset_index(drop=True)
+        self.source = source
+        self.loaded_at = datetime.now()
+        self.row_records, self.by_iata, self.by_icao = build_airport_index(self.df)
+        self.records = list(self.by_iata.values())
+        self.distances = DistanceMatrix(self.df)
+        # La matriz completa se calcula aquí (hilo del cargador) y no en la primera petición
+        self.distances.matrix()
+        self.spatial = SpatialIndex(self.distances.lat, self.distances.lon)
+
+        # Vista ordenada por IATA para filtrar por ventana del mapa y paginar por cursor
+        self.sorted_records = sorted(self.records, key=lambda record: record['iata_code'])
+        self.sorted_codes = np.array([record['iata_code'] for record in self.sorted_records])
+        self.sorted_lat = np.array([record['latitude_deg'] for record in self.sorted_records], dtype=np.float64)
+        self.sorted_lon = np.array([record['longitude_deg'] for record in self.sorted_records], dtype=np.float64)
+        self.sorted_min_zoom = np.array([
+            AIRPORT_MIN_ZOOM.get(record['type'], DEFAULT_MIN_ZOOM) if record.get('type') else 0
+            for record in self.sorted_records
+        ], dtype=np.int64)
+        self.payloads = PayloadCache()
+        self._cluster_levels = {}
+        self._cluster_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.df)
+
+    def clusters(self, zoom):
+        """Nivel de agrupación para un zoom (se calcula la primera vez que se pide)"""
+        level = self._cluster_levels.get(zoom)
+        if level is None:
+            with self._cluster_lock:
+                level = self._cluster_levels.get(zoom)
+                if level is None:
+                    level = ClusterLevel(self.sorted_records, self.sorted_lat, self.sorted_lon, zoom)
+                    self._cluster_levels[zoom] = level
+        return level
+
+    def query(self, bbox=None, zoom=None, cursor=None, limit=None):
+        """Aeropuertos visibles en una ventana y zoom, ordenados por IATA a partir del cursor
+
+        Devuelve (posiciones en sorted_records, siguiente cursor o None, total que cumple el filtro).
+        """
+        mask = np.ones(len(self.sorted_codes), dtype=bool)
+        if bbox is not None:
+            west, south, east, north = bbox
+            mask &= (self.sorted_lat >= south) & (self.sorted_lat <= north)
+            if west <= east:
+                mask &= (self.sorted_lon >= west) & (self.sorted_lon <= east)
+            else:
+                # Ventana que cruza el antimeridiano
+                mask &= (self.sorted_lon >= west) | (self.sorted_lon <= east)
+        if zoom is not None:
+            mask &= self.sorted_min_zoom <= zoom
+
+        start = int(np.searchsorted(self.sorted_codes, cursor, side='right')) if cursor else 0
+        candidates = np.flatnonzero(mask[start:]) + start
+        page = candidates if limit is None else candidates[:limit]
+        next_cursor = None
+        if limit is not None and len(candidates) > limit:
+            next_cursor = str(self.sorted_codes[page[-1]])
+        return page, next_cursor, int(mask.sum())
+
+    def find_airport(self, code):
+        """Buscar un aeropuerto por código IATA o ICAO en O(1) (None si no existe)"""
+        if not isinstance(code, str):
+            return None
+        code = code.strip().upper()
+        return self.by_iata.get(code) or self.by_icao.get(code)
+
+    def status(self):
+        return {
+            'dataset': self.source,
+            'airports': len(self),
+            'countries': int(self.df['iso_country'].nunique()),
+            'loaded_at': self.loaded_at.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
 
+# 'background': se arranca con los datos de respaldo y se carga la tabla completa en un hilo
+# 'sync': la tabla completa se carga en el primer acceso (útil para comandos y scripts)
+AIRPORTS_LOAD_MODE = os.environ.get('AIRPORTS_LOAD_MODE', 'background')
+
+
+class AirportDataLoader:
+    """Capa de datos de aeropuertos con inicialización perezosa y sustitución en caliente"""
+
+    def __init__(self, load_mode=AIRPORTS_LOAD_MODE):
+        self.load_mode = load_mode
+        self.dataset = None
+        self.loading = False
+        self.last_error = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Dataset activo; en el primer acceso arranca la carga completa"""
+        if not self._started:
+            self._start()
+        return self.dataset
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            if self.load_mode == 'sync':
+                self._load()
+            else:
+                # Datos de respaldo incluidos para poder servir inmediatamente
+                self.dataset = AirportDataset(create_fallback_data(), 'fallback')
+                self.loading = True
+                threading.Thread(target=self._load, name='airport-loader', daemon=True).start()
+            self._started = True
+
+    def _load(self, force_refresh=False):
+        try:
+            df, source = load_airport_data(force_refresh=force_refresh)
+            self.swap(AirportDataset(df, source))
+        except Exception as e:
+            print(f"❌ Error cargando aeropuertos: {e}")
+            self.last_error = str(e)
+            if self.dataset is None:
+                self.dataset = AirportDataset(create_fallback_data(), 'fallback')
+        finally:
+            self.loading = False
+
+    def swap(self, dataset):
+        """Publicar un nuevo dataset (las peticiones en curso conservan el anterior)"""
+        self.dataset = dataset
+        self.last_error = None
+        print(f"✅ Dataset de aeropuertos activo: {dataset.source} ({len(dataset)} aeropuertos)")
+        if weather_prefetcher.is_alive():
+            weather_prefetcher.wake()
+
+    def load_now(self, force_refresh=False):
+        """Cargar la tabla completa de forma síncrona (comandos de línea de órdenes)"""
+        with self._lock:
+            self._started = True
+            self._load(force_refresh=force_refresh)
+        return self.dataset
+
+    def status(self):
+        dataset = self.dataset
+        status = dataset.status() if dataset is not None else {'dataset': None, 'airports': 0}
+        status.update({
+            'ready': dataset is not None,
+            'loading': self.loading,
+            'last_error': self.last_error
+        })
+        return status
+
+
+airport_data = AirportDataLoader()
+
+
+def get_airport_data():
+    """Dataset de aeropuertos activo (instantánea inmutable)"""
+    return airport_data.get()
+
+
+def find_airport(code):
+    """Buscar un aeropuerto por código IATA o ICAO en el dataset activo"""
+    return get_airport_data().find_airport(code)
+
+
+# Configuración de la caché de clima (se puede ajustar con variables de entorno)
+WEATHER_CACHE_TTL = float(os.environ.get('WEATHER_CACHE_TTL', 600))  # segundos
+WEATHER_CACHE_MAX_SIZE = int(os.environ.get('WEATHER_CACHE_MAX_SIZE', 10000))  # entradas
+DEFAULT_WEATHER = {'temperature': 15, 'wind_speed': 10, 'wind_direction': 180}
+
+# Configuración del refresco en segundo plano del clima de todos los aeropuertos
+WEATHER_PREFETCH_ENABLED = os.environ.get('WEATHER_PREFETCH_ENABLED', '0') == '1'
+WEATHER_REFRESH_INTERVAL = float(os.environ.get('WEATHER_REFRESH_INTERVAL', 300))  # segundos
+WEATHER_REFRESH_RETRY_DELAY = float(os.environ.get('WEATHER_REFRESH_RETRY_DELAY', 30))  # segundos
+WEATHER_MAX_STALENESS = float(os.environ.get('WEATHER_MAX_STALENESS', 1800))  # segundos
+# 'keep': se sirven los últimos datos (o el clima por defecto) sin bloquear la petición
+# 'fetch': si los datos superan la antigüedad máxima se consulta la API en la petición
+WEATHER_REFRESH_ON_FAILURE = os.environ.get('WEATHER_REFRESH_ON_FAILURE', 'keep')
+WEATHER_BATCH_SIZE = int(os.environ.get('WEATHER_BATCH_SIZE', 100))  # ubicaciones por llamada
+OPEN_METEO_FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+# Consultas de clima concurrentes dentro de una petición
+WEATHER_WORKERS = int(os.environ.get('WEATHER_WORKERS', 8))  # hilos compartidos
+WEATHER_REQUEST_DEADLINE = float(os.environ.get('WEATHER_REQUEST_DEADLINE', 5))  # segundos por petición
+
+
+class WeatherCache:
+    """Caché en memoria con TTL, tamaño máximo y expulsión LRU"""
+
+    def __init__(self, ttl=WEATHER_CACHE_TTL, max_size=WEATHER_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # clave -> (timestamp, valor)
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age=None):
+        """Devuelve el valor si existe y no ha caducado, si no None"""
+        max_age = self.ttl if max_age is None else max_age
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= max_age:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Guarda un valor y expulsa las entradas menos usadas si se supera el tamaño"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Contadores de aciertos/fallos para monitorización"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
 
-def haversine_distance(coord1, coord2):
-    """Calcular distancia real entre aeropuertos"""
-    lat1, lon1 = coord1
-    lat2, lon2 = coord2
 
-    R = 6371.0  # Radio Tierra en km
+weather_cache = WeatherCache()
 
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
 
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
+def weather_cache_key(airport):
+    """Clave de caché: código IATA o, si no hay, lat/lon redondeadas"""
+    iata_code = airport.get('iata_code')
+    if isinstance(iata_code, str) and iata_code:
+        return iata_code
+    return (round(float(airport['latitude_deg']), 2), round(float(airport['longitude_deg']), 2))
+
+
+def lookup_cached_weather(key):
+    """Leer el clima de la caché; devuelve (clima o None, si se permite consultar la API)"""
+    if weather_prefetcher.is_alive():
+        # Con el refresco en segundo plano activo la petición solo lee de memoria
+        weather = weather_cache.get(key, max_age=WEATHER_MAX_STALENESS)
+        return weather, WEATHER_REFRESH_ON_FAILURE == 'fetch'
+    return weather_cache.get(key), True
+
+
+def cached_airport_weather(airport):
+    """Clima de la rejilla interpolada o de la caché, sin consultar la API
+
+    Devuelve (clima o None, si se permite consultar la API).
+    """
+    if weather_grid.is_ready():
+        weather = weather_grid.weather_at([airport['latitude_deg']], [airport['longitude_deg']])[0]
+        if weather is not None:
+            return weather, False
+
+    weather, can_fetch = lookup_cached_weather(weather_cache_key(airport))
+    return (dict(weather) if weather is not None else None), can_fetch
+
 
-    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = R * c
+def fetch_and_cache_weather(airport, timeout=HTTP_TIMEOUT, session=None):
+    """Consultar la API y guardar el resultado en la caché (None si falla)"""
+    weather = fetch_current_weather(airport, timeout, session)
+    if weather is not None:
+        # No se cachean los valores por defecto para reintentar en la próxima petición
+        weather_cache.set(weather_cache_key(airport), weather)
+        return dict(weather)
+    return None
 
-    return distance
 
+def open_meteo_points(url, points, params, timeout=HTTP_TIMEOUT, session=None):
+    """Llamada multi-ubicación a Open-Meteo: una respuesta por punto (lat, lon), en el mismo orden"""
+    session = http_session if session is None else session
+    params = dict(params,
+                  latitude=','.join(str(lat) for lat, _ in points),
+                  longitude=','.join(str(lon) for _, lon in points))
 
-def get_current_weather(airport):
-    """Obtener clima ACTUAL de un aeropuerto"""
+    response = session.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+
+    # Con una sola ubicación la API devuelve un objeto en lugar de una lista
+    return [data] if isinstance(data, dict) else data
+
+
+def airport_points(airports):
+    """Coordenadas (lat, lon) de una lista de aeropuertos"""
+    return [(airport['latitude_deg'], airport['longitude_deg']) for airport in airports]
+
+
+def fetch_current_weather(airport, timeout=HTTP_TIMEOUT, session=None):
+    """Consultar Open-Meteo para el clima actual de un aeropuerto (None si falla)"""
     try:
-        url = "https://api.open-meteo.com/v1/forecast"
         params = {
-            'latitude': airport['latitude_deg'],
-            'longitude': airport['longitude_deg'],
             'current': 'temperature_2m,wind_speed_10m,wind_direction_10m',
             'timezone': 'auto'
         }
-
-        response = requests.get(url, params=params, timeout=10)
-        data = response.json()
+        data = open_meteo_points(OPEN_METEO_FORECAST_URL, airport_points([airport]), params,
+                                 timeout, session)[0]
 
         if 'current' in data:
             return {
@@ -769,7 +1751,580 @@ def get_current_weather(airport):
     except Exception as e:
         print(f"Error clima {airport['iata_code']}: {e}")
 
-    return {'temperature': 15, 'wind_speed': 10, 'wind_direction': 180}
+    return None
+
+
+def fetch_current_weather_bulk(airports, timeout=HTTP_TIMEOUT, session=None):
+    """Consultar el clima actual de varios aeropuertos en una sola llamada a Open-Meteo"""
+    params = {
+        'current': 'temperature_2m,wind_speed_10m,wind_direction_10m',
+        'timezone': 'auto'
+    }
+    data = open_meteo_points(OPEN_METEO_FORECAST_URL, airport_points(airports), params, timeout, session)
+
+    results = {}
+    for airport, location in zip(airports, data):
+        if 'current' in location:
+            results[weather_cache_key(airport)] = {
+                'temperature': location['current']['temperature_2m'],
+                'wind_speed': location['current']['wind_speed_10m'],
+                'wind_direction': location['current']['wind_direction_10m']
+            }
+    return results
+
+
+class BackgroundRefresher:
+    """Hilo que llama periódicamente a refresh(); las subclases implementan refresh()"""
+
+    thread_name = 'refresher'
+    description = 'Refresco en segundo plano'
+
+    def __init__(self, interval, retry_delay):
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self.last_refresh = None
+        self.last_error = None
+        self.refresh_count = 0
+        self.failure_count = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def refresh(self):
+        raise NotImplementedError
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            ok = self.refresh()
+            self._wake_event.wait(self.interval if ok else self.retry_delay)
+            self._wake_event.clear()
+
+    def start(self):
+        if self.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self._thread.start()
+        print(f"{self.description} cada {self.interval:.0f}s")
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def wake(self):
+        """Adelantar el próximo refresco (p. ej. al cambiar la tabla de aeropuertos)"""
+        self._wake_event.set()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+class WeatherPrefetcher(BackgroundRefresher):
+    """Hilo que refresca periódicamente el clima de todos los aeropuertos cargados"""
+
+    thread_name = 'weather-prefetcher'
+    description = '🌤️ Refresco de clima en segundo plano'
+
+    def __init__(self, get_airports, cache, interval=WEATHER_REFRESH_INTERVAL,
+                 retry_delay=WEATHER_REFRESH_RETRY_DELAY, batch_size=WEATHER_BATCH_SIZE):
+        super().__init__(interval, retry_delay)
+        self.get_airports = get_airports
+        self.cache = cache
+        self.batch_size = batch_size
+
+    def refresh(self):
+        """Refresca todos los aeropuertos por lotes; devuelve True si no hubo errores"""
+        airports = self.get_airports()
+        if self.cache.max_size < len(airports):
+            # Todos los aeropuertos deben caber en la caché o se expulsarían entre refrescos
+            print(f"⚠️ Caché de clima ampliada a {len(airports)} entradas")
+            self.cache.max_size = len(airports)
+        ok = True
+        for start in range(0, len(airports), self.batch_size):
+            batch = airports[start:start + self.batch_size]
+            try:
+                for key, weather in fetch_current_weather_bulk(batch).items():
+                    self.cache.set(key, weather)
+            except Exception as e:
+                print(f"❌ Error refrescando clima ({len(batch)} aeropuertos): {e}")
+                self.last_error = str(e)
+                ok = False
+
+        if ok:
+            self.last_refresh = datetime.now()
+            self.last_error = None
+            self.refresh_count += 1
+        else:
+            self.failure_count += 1
+        return ok
+
+    def status(self):
+        return {
+            'running': self.is_alive(),
+            'interval_seconds': self.interval,
+            'max_staleness_seconds': WEATHER_MAX_STALENESS,
+            'on_failure': WEATHER_REFRESH_ON_FAILURE,
+            'last_refresh': self.last_refresh.strftime('%Y-%m-%d %H:%M:%S') if self.last_refresh else None,
+            'last_error': self.last_error,
+            'refresh_count': self.refresh_count,
+            'failure_count': self.failure_count
+        }
+
+
+weather_executor = ThreadPoolExecutor(max_workers=WEATHER_WORKERS, thread_name_prefix='weather')
+
+
+def fetch_in_batches(fetch, items, deadline, batch_size=WEATHER_BATCH_SIZE):
+    """Consultar items en lotes paralelos esperando como mucho deadline segundos
+
+    Cada lote se pide con fetch(lote, timeout, sesión), sin reintentos y con el tiempo restante
+    como timeout, para que un origen lento no deje ocupados los hilos compartidos. Devuelve una
+    lista de (lote, resultado); el resultado es None si el lote falló o no terminó a tiempo.
+    """
+    deadline_at = time.monotonic() + deadline
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    futures = []
+    for batch in batches:
+        remaining = max(0.1, deadline_at - time.monotonic())
+        timeout = (min(HTTP_CONNECT_TIMEOUT, remaining), remaining)
+        futures.append(weather_executor.submit(fetch, batch, timeout, request_http_session))
+    wait(futures, timeout=max(0.0, deadline_at - time.monotonic()))
+
+    results = []
+    for batch, future in zip(batches, futures):
+        if future.done() and future.exception() is None:
+            results.append((batch, future.result()))
+        else:
+            future.cancel()
+            results.append((batch, None))
+    return results
+
+
+def get_weather_for_airports(airports, deadline=None):
+    """Obtener el clima de varios aeropuertos con un tiempo límite global
+
+    La caché se consulta en el hilo de la petición y solo los fallos se piden a la API en
+    paralelo, sin reintentos y con el tiempo restante como timeout. Devuelve (climas, si
+    alguno es el clima por defecto).
+    """
+    deadline = WEATHER_REQUEST_DEADLINE if deadline is None else deadline
+    deadline_at = time.monotonic() + deadline
+    results = []
+    futures = {}
+    for i, airport in enumerate(airports):
+        weather, can_fetch = cached_airport_weather(airport)
+        results.append(weather)
+        if weather is None and can_fetch:
+            remaining = max(0.1, deadline_at - time.monotonic())
+            timeout = (min(HTTP_CONNECT_TIMEOUT, remaining), remaining)
+            futures[i] = weather_executor.submit(fetch_and_cache_weather, airport, timeout, request_http_session)
+
+    wait(futures.values(), timeout=max(0.0, deadline_at - time.monotonic()))
+    for i, future in futures.items():
+        if future.done() and future.exception() is None:
+            results[i] = future.result()
+        elif not future.done():
+            # La consulta termina sola al agotar su timeout y, si responde, quedará en la caché
+            future.cancel()
+            print(f"⏱️ Tiempo límite superado obteniendo clima de {airports[i]['iata_code']}")
+
+    defaulted = any(weather is None for weather in results)
+    return [dict(DEFAULT_WEATHER) if weather is None else weather for weather in results], defaulted
+
+
+def get_weather_bulk(airports, deadline=None):
+    """Obtener el clima de muchos aeropuertos: caché primero y llamadas multi-ubicación para el resto
+
+    Devuelve (diccionario clave de caché -> clima, claves que recibieron el clima por defecto).
+    """
+    deadline = WEATHER_REQUEST_DEADLINE if deadline is None else deadline
+    results = {}
+    defaulted = set()
+    missing = []
+
+    # Con la rejilla activa todos los aeropuertos se interpolan en una sola operación
+    if weather_grid.is_ready() and airports:
+        gridded = weather_grid.weather_at([airport['latitude_deg'] for airport in airports],
+                                          [airport['longitude_deg'] for airport in airports])
+        for airport, weather in zip(airports, gridded):
+            if weather is not None:
+                results[weather_cache_key(airport)] = weather
+
+    for airport in airports:
+        key = weather_cache_key(airport)
+        if key in results:
+            continue
+        weather, can_fetch = lookup_cached_weather(key)
+        if weather is not None:
+            results[key] = dict(weather)
+        elif can_fetch:
+            missing.append(airport)
+        else:
+            results[key] = dict(DEFAULT_WEATHER)
+            defaulted.add(key)
+
+    # Los aeropuertos sin datos se consultan en lotes paralelos
+    for batch, fetched in fetch_in_batches(fetch_current_weather_bulk, missing, deadline):
+        if fetched is None:
+            print(f"❌ No se pudo obtener el clima de {len(batch)} aeropuertos a tiempo")
+            continue
+        for key, weather in fetched.items():
+            weather_cache.set(key, weather)
+            results[key] = dict(weather)
+
+    for airport in missing:
+        key = weather_cache_key(airport)
+        if key not in results:
+            results[key] = dict(DEFAULT_WEATHER)
+            defaulted.add(key)
+    return results, defaulted
+
+
+weather_prefetcher = WeatherPrefetcher(lambda: get_airport_data().records, weather_cache)
+
+
+# Previsión horaria para estimar vuelos con hora de salida futura
+FORECAST_DAYS = int(os.environ.get('FORECAST_DAYS', 3))  # horizonte de la previsión
+FORECAST_CACHE_TTL = float(os.environ.get('FORECAST_CACHE_TTL', 3600))  # segundos
+FORECAST_CACHE_MAX_SIZE = int(os.environ.get('FORECAST_CACHE_MAX_SIZE', 5000))
+HOUR_SECONDS = 3600
+
+
+class HourlyForecast:
+    """Bloque de previsión horaria de un aeropuerto guardado como arrays compactos"""
+
+    __slots__ = ('times', 'temperature', 'wind_speed', 'wind_direction')
+
+    def __init__(self, times, temperature, wind_speed, wind_direction):
+        self.times = np.asarray(times, dtype=np.int64)  # segundos Unix (UTC), ordenados
+        self.temperature = np.asarray(temperature, dtype=np.float64)
+        self.wind_speed = np.asarray(wind_speed, dtype=np.float64)
+        self.wind_direction = np.asarray(wind_direction, dtype=np.float64)
+
+    def positions(self, timestamps):
+        """Índice de la hora que contiene cada instante (-1 fuera del horizonte)"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        index = np.searchsorted(self.times, timestamps, side='right') - 1
+        valid = (index >= 0) & (timestamps < self.times[-1] + HOUR_SECONDS)
+        return np.where(valid, index, -1)
+
+    def columns(self, timestamps):
+        """(temperatura, velocidad, dirección del viento) en cada instante; NaN fuera del horizonte"""
+        index = self.positions(timestamps)
+        valid = index >= 0
+        safe = np.where(valid, index, 0)
+        return tuple(np.where(valid, values[safe], np.nan)
+                     for values in (self.temperature, self.wind_speed, self.wind_direction))
+
+    def at(self, timestamp):
+        """Clima previsto en un instante (None si está fuera del horizonte o falta el dato)"""
+        temperature, wind_speed, wind_direction = (float(v[0]) for v in self.columns([timestamp]))
+        if math.isnan(temperature) or math.isnan(wind_speed) or math.isnan(wind_direction):
+            return None
+        return {'temperature': temperature, 'wind_speed': wind_speed, 'wind_direction': wind_direction}
+
+
+forecast_cache = WeatherCache(ttl=FORECAST_CACHE_TTL, max_size=FORECAST_CACHE_MAX_SIZE)
+
+
+def fetch_hourly_forecast_bulk(airports, timeout=HTTP_TIMEOUT, session=None):
+    """Consultar la previsión horaria de varios aeropuertos en una sola llamada a Open-Meteo"""
+    params = {
+        'hourly': 'temperature_2m,wind_speed_10m,wind_direction_10m',
+        'forecast_days': FORECAST_DAYS,
+        'timeformat': 'unixtime',
+        'timezone': 'GMT'
+    }
+    data = open_meteo_points(OPEN_METEO_FORECAST_URL, airport_points(airports), params, timeout, session)
+
+    results = {}
+    for airport, location in zip(airports, data):
+        hourly = location.get('hourly')
+        if hourly and hourly.get('time'):
+            results[weather_cache_key(airport)] = HourlyForecast(
+                hourly['time'],
+                np.array(hourly['temperature_2m'], dtype=np.float64),
+                np.array(hourly['wind_speed_10m'], dtype=np.float64),
+                np.array(hourly['wind_direction_10m'], dtype=np.float64)
+            )
+    return results
+
+
+def get_forecasts(airports, deadline=None):
+    """Previsiones horarias de varios aeropuertos: caché primero y llamadas multi-ubicación para el resto
+
+    Devuelve un diccionario clave de caché -> HourlyForecast (None si no se pudo obtener).
+    """
+    deadline = WEATHER_REQUEST_DEADLINE if deadline is None else deadline
+    results = {}
+    missing = []
+    for airport in airports:
+        key = weather_cache_key(airport)
+        if key in results:
+            continue
+        forecast = forecast_cache.get(key)
+        results[key] = forecast
+        if forecast is None:
+            missing.append(airport)
+
+    for batch, fetched in fetch_in_batches(fetch_hourly_forecast_bulk, missing, deadline):
+        if fetched is None:
+            print(f"❌ No se pudo obtener la previsión de {len(batch)} aeropuertos a tiempo")
+            continue
+        for key, forecast in fetched.items():
+            forecast_cache.set(key, forecast)
+            results[key] = forecast
+    return results
+
+
+# Margen admitido para las horas de salida respecto a ahora (fuera de él son errores de entrada)
+DEPARTURE_TIME_MAX_YEARS = int(os.environ.get('DEPARTURE_TIME_MAX_YEARS', 10))
+
+
+def parse_departure_time(value):
+    """Hora de salida en segundos Unix: número Unix o fecha ISO 8601 (sin zona = UTC)
+
+    Lanza ValueError si la fecha se aleja más de DEPARTURE_TIME_MAX_YEARS años de ahora.
+    """
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        timestamp = int(value)
+    else:
+        moment = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        timestamp = int(moment.timestamp())
+    if abs(timestamp - time.time()) > DEPARTURE_TIME_MAX_YEARS * 366 * 24 * HOUR_SECONDS:
+        raise ValueError(value)
+    return timestamp
+
+
+def format_timestamp(timestamp):
+    """Segundos Unix a texto ISO 8601 en UTC"""
+    return datetime.fromtimestamp(int(timestamp), tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+# Histórico de clima horario en disco (una partición .npz por mes)
+WEATHER_HISTORY_DIR = os.environ.get('WEATHER_HISTORY_DIR', 'weather_history')
+WEATHER_HISTORY_CACHE_PARTITIONS = int(os.environ.get('WEATHER_HISTORY_CACHE_PARTITIONS', 3))  # meses en memoria
+WEATHER_ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+WEATHER_HISTORY_FIELDS = ('temperature', 'wind_speed', 'wind_direction')
+
+
+def month_bounds(month):
+    """'AAAA-MM' -> (inicio, fin exclusivo) en segundos Unix UTC"""
+    start = np.datetime64(month, 'M')
+    return (int(start.astype('datetime64[s]').astype(np.int64)),
+            int((start + 1).astype('datetime64[s]').astype(np.int64)))
+
+
+def timestamp_months(timestamps):
+    """Mes 'AAAA-MM' de cada instante (segundos Unix)"""
+    return np.asarray(timestamps, dtype='datetime64[s]').astype('datetime64[M]').astype(str)
+
+
+class WeatherHistory:
+    """Histórico horario por aeropuerto en columnas: una matriz aeropuerto x hora por variable y mes
+
+    Los valores se guardan en float32 y se redondean a una décima al leerlos, que es la
+    precisión de Open-Meteo, así que el modelo recibe exactamente los valores originales.
+    """
+
+    def __init__(self, directory=WEATHER_HISTORY_DIR, cache_size=WEATHER_HISTORY_CACHE_PARTITIONS):
+        self.directory = directory
+        self.cache_size = cache_size
+        self._partitions = OrderedDict()  # mes -> partición cargada (LRU)
+        self._staged = {}  # mes -> partición pendiente de guardar
+
+    def path(self, month):
+        return os.path.join(self.directory, f'{month}.npz')
+
+    def months(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith('.npz'))
+
+    def load(self, month):
+        """Partición de un mes ({'codes', 'position', 'start', campos...}) o None si no existe"""
+        if month in self._partitions:
+            self._partitions.move_to_end(month)
+            return self._partitions[month]
+        if not os.path.exists(self.path(month)):
+            return None
+
+        with np.load(self.path(month)) as data:
+            codes = data['codes'].astype(str)
+            partition = {
+                'codes': codes,
+                'position': {code: i for i, code in enumerate(codes)},
+                'start': int(data['start'])
+            }
+            for field in WEATHER_HISTORY_FIELDS:
+                partition[field] = data[field]
+
+        self._partitions[month] = partition
+        while len(self._partitions) > self.cache_size:
+            self._partitions.popitem(last=False)
+        return partition
+
+    def stage(self, month, codes, timestamps, values):
+        """Mezclar observaciones (códigos, instantes, {campo: valores}) en la partición pendiente del mes
+
+        La partición se guarda en disco con flush(); devuelve el número de observaciones del mes.
+        """
+        start, end = month_bounds(month)
+        hours = (end - start) // HOUR_SECONDS
+        staged = self._staged.get(month)
+        if staged is None:
+            existing = self.load(month)
+            staged = {'start': start, 'codes': [], 'position': {}}
+            for field in WEATHER_HISTORY_FIELDS:
+                staged[field] = np.empty((0, hours), dtype=np.float32)
+            if existing is not None:
+                staged['codes'] = existing['codes'].tolist()
+                staged['position'] = dict(existing['position'])
+                for field in WEATHER_HISTORY_FIELDS:
+                    staged[field] = existing[field].astype(np.float32)
+            self._staged[month] = staged
+
+        # Los aeropuertos nuevos se añaden como filas vacías
+        new_codes = [code for code in dict.fromkeys(codes) if code not in staged['position']]
+        if new_codes:
+            for code in new_codes:
+                staged['position'][code] = len(staged['codes'])
+                staged['codes'].append(code)
+            for field in WEATHER_HISTORY_FIELDS:
+                staged[field] = np.vstack([staged[field],
+                                           np.full((len(new_codes), hours), np.nan, dtype=np.float32)])
+
+        rows = np.array([staged['position'][code] for code in codes], dtype=np.int64)
+        columns = (np.asarray(timestamps, dtype=np.int64) - start) // HOUR_SECONDS
+        valid = (columns >= 0) & (columns < hours)
+        for field in WEATHER_HISTORY_FIELDS:
+            staged[field][rows[valid], columns[valid]] = np.asarray(values[field], dtype=np.float32)[valid]
+        return int(valid.sum())
+
+    def staged_months(self):
+        return sorted(self._staged)
+
+    def flush(self, months=None):
+        """Guardar las particiones pendientes (todas o las de months): una escritura por mes"""
+        months = self.staged_months() if months is None else [month for month in months if month in self._staged]
+        if months:
+            os.makedirs(self.directory, exist_ok=True)
+        for month in months:
+            staged = self._staged.pop(month)
+            codes = np.array(staged['codes'])
+            order = np.argsort(codes, kind='stable')
+            # Escritura atómica: se escribe en un temporal y se renombra
+            tmp_path = self.path(month) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, codes=codes[order], start=np.int64(staged['start']),
+                                    **{field: staged[field][order] for field in WEATHER_HISTORY_FIELDS})
+            os.replace(tmp_path, self.path(month))
+            self._partitions.pop(month, None)
+        return months
+
+    def write(self, month, codes, timestamps, values):
+        """Guardar observaciones mezclándolas con la partición existente (stage + flush de un mes)"""
+        written = self.stage(month, codes, timestamps, values)
+        airports = len(self._staged[month]['codes'])
+        self.flush([month])
+        return airports, written
+
+    def lookup(self, codes, timestamps):
+        """Columnas (temperatura, velocidad, dirección) en cada (aeropuerto, instante); NaN sin dato"""
+        codes = np.asarray(codes, dtype=object)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        results = [np.full(len(timestamps), np.nan) for _ in WEATHER_HISTORY_FIELDS]
+        months = timestamp_months(timestamps)
+
+        for month in np.unique(months):
+            partition = self.load(month)
+            if partition is None:
+                continue
+            selected = np.flatnonzero(months == month)
+            positions, unique = pd.factorize(codes[selected], use_na_sentinel=False)
+            rows = np.array([partition['position'].get(code, -1) for code in unique], dtype=np.int64)[positions]
+            columns = (timestamps[selected] - partition['start']) // HOUR_SECONDS
+            found = rows >= 0
+            for result, field in zip(results, WEATHER_HISTORY_FIELDS):
+                result[selected[found]] = np.round(
+                    partition[field][rows[found], columns[found]].astype(np.float64), 1)
+        return tuple(results)
+
+
+weather_history = WeatherHistory()
+
+
+def parse_time_column(values):
+    """Columna de fechas (ISO 8601 o segundos Unix) -> (segundos Unix, válidos)"""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        seconds = values.to_numpy(dtype=np.float64)
+    else:
+        moments = pd.to_datetime(values, utc=True, errors='coerce', format='mixed')
+        seconds = ((moments - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
+    valid = ~np.isnan(seconds)
+    return np.where(valid, seconds, 0).astype(np.int64), valid
+
+
+def normalize_codes(values):
+    """Columna de códigos IATA en mayúsculas y sin espacios"""
+    return pd.Series(values).astype(str).str.strip().str.upper().to_numpy(dtype=object)
+
+
+def predict_historical_durations(airports, origin_codes, dest_codes, departures, aircraft_types,
+                                 history=weather_history):
+    """Duraciones con el clima histórico para columnas de vuelos
+
+    Devuelve (distancias, duraciones, estado) con estado 'ok', 'airport' (aeropuerto
+    desconocido) o 'weather' (falta algún dato del clima histórico usado); las duraciones sin
+    estado 'ok' son NaN.
+    """
+    origin_codes = normalize_codes(origin_codes)
+    dest_codes = normalize_codes(dest_codes)
+
+    def positions(codes):
+        index, unique = pd.factorize(codes, use_na_sentinel=False)
+        return airports.distances.indices(list(unique))[index]
+
+    origin_idx, dest_idx = positions(origin_codes), positions(dest_codes)
+    known = (origin_idx >= 0) & (dest_idx >= 0)
+    distances = np.full(len(origin_codes), np.nan)
+    distances[known] = airports.distances.pair_distances(origin_idx[known], dest_idx[known])
+
+    taxi_out, taxi_in = taxi_times.columns(origin_codes, dest_codes)
+    durations = calculate_durations_at_times(
+        distances, departures, history.lookup(origin_codes, departures),
+        lambda timestamps: history.lookup(dest_codes, timestamps), aircraft_types, taxi_out, taxi_in)
+
+    status = np.where(~known, 'airport', np.where(np.isnan(durations), 'weather', 'ok'))
+    return distances, durations, status
+
+
+def fetch_archive_bulk(airports, start_date, end_date):
+    """Clima horario histórico de varios aeropuertos en una sola llamada al archivo de Open-Meteo
+
+    Devuelve (instantes, {campo: matriz aeropuerto x hora}).
+    """
+    params = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'hourly': 'temperature_2m,wind_speed_10m,wind_direction_10m',
+        'timeformat': 'unixtime',
+        'timezone': 'GMT'
+    }
+    data = open_meteo_points(WEATHER_ARCHIVE_URL, airport_points(airports), params,
+                             timeout=(HTTP_CONNECT_TIMEOUT, 60))
+
+    times = np.array(data[0]['hourly']['time'], dtype=np.int64)
+    values = {
+        field: np.array([location['hourly'][name] for location in data], dtype=np.float64)
+        for field, name in zip(WEATHER_HISTORY_FIELDS, ('temperature_2m', 'wind_speed_10m', 'wind_direction_10m'))
+    }
+    return times, values
 
 
 def calculate_wind_effect(origin_weather, dest_weather):
@@ -815,38 +2370,807 @@ def calculate_temperature_effect(origin_weather, dest_weather):
         return 1.10
 
 
-def calculate_improved_duration(distance_km, origin_weather, dest_weather, aircraft_type='medium_haul'):
-    """Calcula duración de vuelo mejorada"""
-    # Definir velocidades de crucero por tipo de avión
-    aircraft_speeds = {
-        'medium_haul': 840,  # km/h (ej. A320, B737)
-        'long_haul': 920     # km/h (ej. A350, B787)
-    }
-    
-    cruise_speed = aircraft_speeds.get(aircraft_type, 840) # Default a medium_haul
-    
-    base_flight_duration = (distance_km / cruise_speed) * 60
-    wind_effect = calculate_wind_effect(origin_weather, dest_weather)
+# Catálogo de rendimiento de aeronaves por código de tipo OACI
+AIRCRAFT_CATALOGUE_PATH = os.environ.get(
+    'AIRCRAFT_CATALOGUE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aircraft_performance.csv'))
+AIRCRAFT_NUMERIC_COLUMNS = ['cruise_speed_kmh', 'cruise_altitude_ft', 'climb_speed_kmh', 'climb_rate_fpm',
+                            'descent_speed_kmh', 'descent_rate_fpm', 'taxi_out_min', 'taxi_in_min']
+DEFAULT_AIRCRAFT_TYPE = 'medium_haul'  # perfil usado para tipos desconocidos
+
+
+def create_fallback_aircraft():
+    """Perfiles genéricos de respaldo si no se puede leer el catálogo"""
+    return pd.DataFrame({
+        'icao_type': ['medium_haul', 'long_haul'],
+        'name': ['Medio Radio genérico (ej. A320 / B737)', 'Largo Radio genérico (ej. A350 / B787)'],
+        'category': ['generic', 'generic'],
+        'cruise_speed_kmh': [840, 920],
+        'cruise_altitude_ft': [37000, 39000],
+        'climb_speed_kmh': [600, 640],
+        'climb_rate_fpm': [2000, 1800],
+        'descent_speed_kmh': [620, 660],
+        'descent_rate_fpm': [2200, 2000],
+        'taxi_out_min': [15, 18],
+        'taxi_in_min': [8, 10]
+    })
+
+
+class AircraftCatalogue:
+    """Tabla de rendimiento de aeronaves: un array por columna y un índice código -> fila"""
+
+    def __init__(self, df):
+        df = df.drop_duplicates('icao_type', keep='last').reset_index(drop=True)
+        self.codes = df['icao_type'].tolist()
+        self.names = df['name'].tolist()
+        self.categories = df['category'].tolist()
+        self.position = {code.upper(): i for i, code in enumerate(self.codes)}
+        self.columns = {column: df[column].to_numpy(dtype=np.float64) for column in AIRCRAFT_NUMERIC_COLUMNS}
+        self.default_position = self.position.get(DEFAULT_AIRCRAFT_TYPE.upper(), 0)
+        self._warned = set()
+
+    def find(self, aircraft_type):
+        """Fila del tipo de avión o None si no está en el catálogo"""
+        if not isinstance(aircraft_type, str):
+            return None
+        return self.position.get(aircraft_type.strip().upper())
+
+    def lookup(self, aircraft_type):
+        """Fila del tipo de avión; los tipos desconocidos usan el perfil por defecto con un aviso"""
+        position = self.find(aircraft_type)
+        if position is None:
+            # Un aviso por tipo (con límite para no crecer sin fin con entradas arbitrarias)
+            if aircraft_type not in self._warned and len(self._warned) < 1000:
+                self._warned.add(aircraft_type)
+                print(f"⚠️ Tipo de avión desconocido '{aircraft_type}': se usa {DEFAULT_AIRCRAFT_TYPE}")
+            return self.default_position
+        return position
+
+    def positions(self, aircraft_types):
+        """Filas de una columna de tipos de avión (un dict lookup por tipo distinto)"""
+        codes, types = pd.factorize(np.ravel(np.asarray(aircraft_types, dtype=object)), use_na_sentinel=False)
+        rows = np.array([self.lookup(t) for t in types], dtype=np.int64)
+        return rows[codes].reshape(np.shape(aircraft_types))
+
+    def value(self, column, aircraft_type):
+        return float(self.columns[column][self.lookup(aircraft_type)])
+
+    def column(self, column, aircraft_types):
+        return self.columns[column][self.positions(aircraft_types)]
+
+    def unknown_warning(self, aircraft_type):
+        """Texto de aviso para la respuesta de la API (None si el tipo existe)"""
+        if self.find(aircraft_type) is not None:
+            return None
+        return f"Tipo de avión desconocido '{aircraft_type}': se usa el perfil {DEFAULT_AIRCRAFT_TYPE}"
+
+    def records(self):
+        return [
+            dict({'icao_type': code, 'name': name, 'category': category},
+                 **{column: float(self.columns[column][i]) for column in AIRCRAFT_NUMERIC_COLUMNS})
+            for i, (code, name, category) in enumerate(zip(self.codes, self.names, self.categories))
+        ]
+
+
+def load_aircraft_catalogue(path=AIRCRAFT_CATALOGUE_PATH):
+    """Leer el catálogo de aeronaves (CSV) una sola vez al arrancar"""
+    try:
+        df = pd.read_csv(path, dtype={'icao_type': str, 'name': str, 'category': str},
+                         usecols=['icao_type', 'name', 'category'] + AIRCRAFT_NUMERIC_COLUMNS)
+        df = df.dropna()
+        print(f"✅ Catálogo de aeronaves: {len(df)} tipos")
+    except Exception as e:
+        print(f"❌ Error leyendo el catálogo de aeronaves ({path}): {e}")
+        df = create_fallback_aircraft()
+    return AircraftCatalogue(df)
+
+
+aircraft_catalogue = load_aircraft_catalogue()
+
+
+# Tiempos de rodaje por aeropuerto (sustituyen a los del avión cuando existen)
+AIRPORT_TAXI_TIMES_PATH = os.environ.get(
+    'AIRPORT_TAXI_TIMES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'airport_taxi_times.csv'))
+
+
+class TaxiTimeTable:
+    """Rodaje de salida y de llegada por código IATA: un dict código -> (salida, llegada)"""
+
+    def __init__(self, df):
+        df = df.drop_duplicates('iata_code', keep='last')
+        self.times = {
+            code.upper(): (float(taxi_out), float(taxi_in))
+            for code, taxi_out, taxi_in in zip(df['iata_code'], df['taxi_out_min'], df['taxi_in_min'])
+        }
+
+    def __len__(self):
+        return len(self.times)
+
+    def for_route(self, origin_iata, dest_iata):
+        """(rodaje de salida en origen, rodaje de llegada en destino); None si no hay dato"""
+        origin = self.times.get(str(origin_iata).upper())
+        dest = self.times.get(str(dest_iata).upper())
+        return (origin[0] if origin else None), (dest[1] if dest else None)
+
+    def _column(self, codes, which):
+        """Un dict lookup por código distinto; NaN donde no hay dato"""
+        positions, unique = pd.factorize(np.asarray(codes, dtype=object), use_na_sentinel=False)
+        values = np.array([self.times.get(str(code).upper(), (math.nan, math.nan))[which] for code in unique],
+                          dtype=np.float64)
+        return values[positions]
+
+    def columns(self, origin_codes, dest_codes):
+        """Versión por columnas de for_route: (rodajes de salida, rodajes de llegada)"""
+        return self._column(origin_codes, 0), self._column(dest_codes, 1)
+
+
+def load_taxi_times(path=AIRPORT_TAXI_TIMES_PATH):
+    """Leer la tabla de rodajes por aeropuerto (CSV) una sola vez al arrancar"""
+    try:
+        df = pd.read_csv(path, dtype={'iata_code': str},
+                         usecols=['iata_code', 'taxi_out_min', 'taxi_in_min']).dropna()
+        print(f"✅ Tiempos de rodaje: {len(df)} aeropuertos")
+    except Exception as e:
+        print(f"❌ Error leyendo los tiempos de rodaje ({path}): {e}")
+        df = pd.DataFrame(columns=['iata_code', 'taxi_out_min', 'taxi_in_min'])
+    return TaxiTimeTable(df)
+
+
+taxi_times = load_taxi_times()
+
+
+def phase_times(distance_km, cruise_speed, cruise_altitude, climb_speed, climb_rate, descent_speed, descent_rate):
+    """Minutos de ascenso, crucero y descenso en aire en calma (forma cerrada, escalares o arrays)"""
+    climb_min = cruise_altitude / climb_rate
+    descent_min = cruise_altitude / descent_rate
+    climb_km = climb_speed * climb_min / 60
+    descent_km = descent_speed * descent_min / 60
+
+    # En trayectos cortos no se llega a la altitud de crucero: ascenso y descenso se acortan en proporción
+    scale = np.minimum(1.0, distance_km / (climb_km + descent_km))
+    cruise_km = np.maximum(distance_km - (climb_km + descent_km) * scale, 0.0)
+    return climb_min * scale, cruise_km / cruise_speed * 60, descent_min * scale
+
+
+def calculate_flight_phases(distance_km, origin_weather, dest_weather, aircraft_type='medium_haul',
+                            taxi_out=None, taxi_in=None, wind_effect=None):
+    """Duración por fases (rodaje de salida, ascenso, crucero, descenso, rodaje de llegada)
+
+    El viento y la temperatura afectan solo a las fases en el aire. Los rodajes son los
+    del avión salvo que se indiquen los del aeropuerto. Devuelve (total, {fase: minutos}).
+    """
+    position = aircraft_catalogue.lookup(aircraft_type)
+    columns = aircraft_catalogue.columns
+    climb, cruise, descent = (float(t) for t in phase_times(
+        distance_km, columns['cruise_speed_kmh'][position], columns['cruise_altitude_ft'][position],
+        columns['climb_speed_kmh'][position], columns['climb_rate_fpm'][position],
+        columns['descent_speed_kmh'][position], columns['descent_rate_fpm'][position]))
+    taxi_out = float(columns['taxi_out_min'][position]) if taxi_out is None else taxi_out
+    taxi_in = float(columns['taxi_in_min'][position]) if taxi_in is None else taxi_in
+
+    if wind_effect is None:
+        wind_effect = calculate_wind_effect(origin_weather, dest_weather)
     temp_effect = calculate_temperature_effect(origin_weather, dest_weather)
-    ground_operations = 45
+    weather_effect = wind_effect * temp_effect
+
+    airborne = climb + cruise + descent
+    total_duration = airborne * weather_effect + taxi_out + taxi_in
+    phases = {
+        'taxi_out': round(taxi_out, 2),
+        'climb': round(climb * weather_effect, 2),
+        'cruise': round(cruise * weather_effect, 2),
+        'descent': round(descent * weather_effect, 2),
+        'taxi_in': round(taxi_in, 2)
+    }
+    return total_duration, phases
 
-    flight_duration = base_flight_duration * wind_effect * temp_effect
-    total_duration = flight_duration + ground_operations
 
+def calculate_improved_duration(distance_km, origin_weather, dest_weather, aircraft_type='medium_haul',
+                                taxi_out=None, taxi_in=None):
+    """Calcula duración de vuelo mejorada"""
+    total_duration, _ = calculate_flight_phases(distance_km, origin_weather, dest_weather, aircraft_type,
+                                                taxi_out, taxi_in)
     return round(total_duration, 2)
 
 
+def calculate_wind_effect_array(origin_wind_speed, dest_wind_speed, origin_wind_dir, dest_wind_dir):
+    """Versión vectorizada de calculate_wind_effect sobre columnas de viento"""
+    origin_wind_speed = np.asarray(origin_wind_speed, dtype=np.float64)
+    dest_wind_speed = np.asarray(dest_wind_speed, dtype=np.float64)
+    avg_wind_speed = (origin_wind_speed + dest_wind_speed) / 2
+
+    wind_factor = np.select(
+        [avg_wind_speed <= 10, avg_wind_speed <= 25, avg_wind_speed <= 40],
+        [1.0, 1 + (avg_wind_speed * 0.002), 1 + (avg_wind_speed * 0.003)],
+        1 + (avg_wind_speed * 0.004)
+    )
+
+    wind_dir_difference = np.abs(np.asarray(origin_wind_dir, dtype=np.float64) -
+                                 np.asarray(dest_wind_dir, dtype=np.float64))
+    return np.where(wind_dir_difference > 90, wind_factor * 1.05, wind_factor)
+
+
+def calculate_temperature_effect_array(origin_temp, dest_temp):
+    """Versión vectorizada de calculate_temperature_effect sobre columnas de temperatura"""
+    avg_temp = (np.asarray(origin_temp, dtype=np.float64) + np.asarray(dest_temp, dtype=np.float64)) / 2
+
+    return np.select(
+        [
+            (10 <= avg_temp) & (avg_temp <= 20),
+            ((5 <= avg_temp) & (avg_temp < 10)) | ((20 < avg_temp) & (avg_temp <= 25)),
+            ((0 <= avg_temp) & (avg_temp < 5)) | ((25 < avg_temp) & (avg_temp <= 30)),
+            ((-10 <= avg_temp) & (avg_temp < 0)) | ((30 < avg_temp) & (avg_temp <= 35))
+        ],
+        [1.0, 1.02, 1.04, 1.07],
+        1.10
+    )
+
+
+def round_like_python(values, decimals=2):
+    """np.round con el mismo resultado que round() de Python, también en los empates"""
+    values = np.asarray(values, dtype=np.float64)
+    rounded = np.round(values, decimals)
+    # Solo los valores casi a mitad de camino pueden diferir: se redondean uno a uno
+    scaled = values * 10 ** decimals
+    near_tie = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for i in near_tie:
+        rounded.flat[i] = round(float(values.flat[i]), decimals)
+    return rounded
+
+
+def calculate_improved_duration_array(distance_km, origin_wind_speed, dest_wind_speed,
+                                      origin_wind_dir, dest_wind_dir, origin_temp, dest_temp,
+                                      aircraft_type='medium_haul', taxi_out=None, taxi_in=None):
+    """Versión vectorizada de calculate_improved_duration: columnas de entrada -> duraciones"""
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+    rows = aircraft_catalogue.positions(np.broadcast_to(np.asarray(aircraft_type, dtype=object),
+                                                        distance_km.shape))
+    columns = aircraft_catalogue.columns
+    climb, cruise, descent = phase_times(
+        distance_km, columns['cruise_speed_kmh'][rows], columns['cruise_altitude_ft'][rows],
+        columns['climb_speed_kmh'][rows], columns['climb_rate_fpm'][rows],
+        columns['descent_speed_kmh'][rows], columns['descent_rate_fpm'][rows])
+    # Rodajes del aeropuerto cuando se indican (NaN = sin dato) y si no los del avión
+    taxi_out = columns['taxi_out_min'][rows] if taxi_out is None else \
+        np.where(np.isnan(np.asarray(taxi_out, dtype=np.float64)), columns['taxi_out_min'][rows], taxi_out)
+    taxi_in = columns['taxi_in_min'][rows] if taxi_in is None else \
+        np.where(np.isnan(np.asarray(taxi_in, dtype=np.float64)), columns['taxi_in_min'][rows], taxi_in)
+
+    wind_effect = calculate_wind_effect_array(origin_wind_speed, dest_wind_speed,
+                                              origin_wind_dir, dest_wind_dir)
+    temp_effect = calculate_temperature_effect_array(origin_temp, dest_temp)
+    weather_effect = wind_effect * temp_effect
+
+    airborne = climb + cruise + descent
+    total_duration = airborne * weather_effect + taxi_out + taxi_in
+
+    return round_like_python(total_duration, 2)
+
+
+def weather_columns(weather_list):
+    """Convertir una lista de dicts de clima en columnas (temperatura, velocidad, dirección)"""
+    temperature = np.array([w.get('temperature', 15) for w in weather_list], dtype=np.float64)
+    wind_speed = np.array([w.get('wind_speed', 10) for w in weather_list], dtype=np.float64)
+    wind_direction = np.array([w.get('wind_direction', 180) for w in weather_list], dtype=np.float64)
+    return temperature, wind_speed, wind_direction
+
+
+def calculate_durations_at_times(distance_km, departures, origin_columns, dest_weather_at,
+                                 aircraft_type='medium_haul', taxi_out=None, taxi_in=None):
+    """Duraciones con el clima de origen a la salida y el de destino a la llegada estimada
+
+    origin_columns son las columnas (temperatura, velocidad, dirección) en cada salida y
+    dest_weather_at(instantes) devuelve las del destino; se hace una segunda pasada con el
+    clima de la hora de llegada cuando existe, igual que /api/calculate con departure_time.
+    La duración es NaN si falta algún dato del clima usado: los efectos tratan una temperatura
+    NaN como extrema en lugar de propagarla, así que se comprueban las columnas de entrada.
+    """
+    departures = np.asarray(departures, dtype=np.int64)
+    origin_temp, origin_wind_speed, origin_wind_dir = origin_columns
+    dest_temp, dest_wind_speed, dest_wind_dir = dest_weather_at(departures)
+    durations = calculate_improved_duration_array(
+        distance_km, origin_wind_speed, dest_wind_speed, origin_wind_dir, dest_wind_dir,
+        origin_temp, dest_temp, aircraft_type, taxi_out, taxi_in)
+
+    arrival_temp, arrival_wind_speed, arrival_wind_dir = dest_weather_at(
+        departures + (np.nan_to_num(durations) * 60).astype(np.int64))
+    at_arrival = ~(np.isnan(arrival_temp) | np.isnan(arrival_wind_speed) | np.isnan(arrival_wind_dir))
+    dest_temp = np.where(at_arrival, arrival_temp, dest_temp)
+    dest_wind_speed = np.where(at_arrival, arrival_wind_speed, dest_wind_speed)
+    dest_wind_dir = np.where(at_arrival, arrival_wind_dir, dest_wind_dir)
+    durations = np.where(at_arrival, calculate_improved_duration_array(
+        distance_km, origin_wind_speed, dest_wind_speed, origin_wind_dir, dest_wind_dir,
+        origin_temp, dest_temp, aircraft_type, taxi_out, taxi_in), durations)
+
+    missing = np.zeros(np.shape(durations), dtype=bool)
+    for column in (origin_temp, origin_wind_speed, origin_wind_dir, dest_temp, dest_wind_speed, dest_wind_dir):
+        missing |= np.isnan(np.asarray(column, dtype=np.float64))
+    return np.where(missing, np.nan, durations)
+
+
+# Integración del viento en altura a lo largo de la ruta ortodrómica
+ROUTE_SEGMENTS = int(os.environ.get('ROUTE_SEGMENTS', 50))
+ROUTE_WIND_LEVEL = os.environ.get('ROUTE_WIND_LEVEL', '250hPa')  # ~FL340, nivel de crucero típico
+ROUTE_WIND_RESOLUTION = float(os.environ.get('ROUTE_WIND_RESOLUTION', 0.5))  # grados de la rejilla de caché
+MIN_GROUND_SPEED_RATIO = 0.5  # el viento nunca reduce la velocidad a menos de la mitad
+ROUTE_WIND_CACHE_MAX_SIZE = int(os.environ.get('ROUTE_WIND_CACHE_MAX_SIZE', 20000))  # puntos de la rejilla
+
+# Caché propia para no competir por las entradas del clima de los aeropuertos
+route_wind_cache = WeatherCache(max_size=ROUTE_WIND_CACHE_MAX_SIZE)
+
+
+def great_circle_waypoints(lat1, lon1, lat2, lon2, segments=ROUTE_SEGMENTS):
+    """Puntos equiespaciados sobre la ortodrómica entre dos coordenadas (segments + 1 puntos)"""
+    start = unit_vectors(lat1, lon1)
+    end = unit_vectors(lat2, lon2)
+    omega = np.arccos(np.clip(np.dot(start, end), -1.0, 1.0))
+    fractions = np.linspace(0.0, 1.0, segments + 1)[:, None]
+
+    if omega < 1e-12:
+        points = np.repeat(start[None, :], segments + 1, axis=0)
+    else:
+        # Interpolación esférica (slerp) entre los dos vectores unitarios
+        points = (np.sin((1 - fractions) * omega) * start + np.sin(fractions * omega) * end) / np.sin(omega)
+
+    lat = np.degrees(np.arcsin(np.clip(points[:, 2], -1.0, 1.0)))
+    lon = np.degrees(np.arctan2(points[:, 1], points[:, 0]))
+    return lat, lon
+
+
+def segment_geometry(lat, lon):
+    """Longitud (km), rumbo inicial (grados) y punto medio de cada tramo de una ruta"""
+    lat1, lon1, lat2, lon2 = lat[:-1], lon[:-1], lat[1:], lon[1:]
+    lengths = haversine_distance_array(lat1, lon1, lat2, lon2)
+
+    lat1_rad, lat2_rad = np.radians(lat1), np.radians(lat2)
+    dlon = np.radians(lon2 - lon1)
+    bearings = np.degrees(np.arctan2(
+        np.sin(dlon) * np.cos(lat2_rad),
+        np.cos(lat1_rad) * np.sin(lat2_rad) - np.sin(lat1_rad) * np.cos(lat2_rad) * np.cos(dlon)
+    )) % 360
+
+    # Punto medio aproximado: media de los extremos (los tramos son cortos)
+    mid_lat = (lat1 + lat2) / 2
+    mid_lon = np.degrees(np.arctan2(np.sin(np.radians(lon1)) + np.sin(np.radians(lon2)),
+                                    np.cos(np.radians(lon1)) + np.cos(np.radians(lon2))))
+    return lengths, bearings, mid_lat, mid_lon
+
+
+def tailwind_component(wind_speed, wind_direction, bearing):
+    """Componente del viento a favor (positiva) o en contra (negativa) sobre el rumbo
+
+    La dirección meteorológica indica de dónde sopla el viento.
+    """
+    return -np.asarray(wind_speed) * np.cos(np.radians(np.asarray(wind_direction) - np.asarray(bearing)))
+
+
+def integrate_route_time(lengths, bearings, wind_speed, wind_direction, cruise_speed):
+    """Tiempo de vuelo en minutos sumando cada tramo a su velocidad respecto al suelo
+
+    Admite varias rutas a la vez (arrays 2D: ruta x tramo).
+    """
+    cruise_speed = np.asarray(cruise_speed, dtype=np.float64)[..., None]
+    tailwind = tailwind_component(wind_speed, wind_direction, bearings)
+    ground_speed = np.maximum(cruise_speed + tailwind, cruise_speed * MIN_GROUND_SPEED_RATIO)
+    return np.sum(lengths / ground_speed, axis=-1) * 60
+
+
+def route_wind_key(lat, lon):
+    """Clave de caché del viento en altura: punto ajustado a la rejilla configurada"""
+    return ('upper', ROUTE_WIND_LEVEL,
+            round(round(lat / ROUTE_WIND_RESOLUTION) * ROUTE_WIND_RESOLUTION, 4),
+            round(round(lon / ROUTE_WIND_RESOLUTION) * ROUTE_WIND_RESOLUTION, 4))
+
+
+def fetch_upper_winds_bulk(points, timeout=HTTP_TIMEOUT, session=None):
+    """Viento en altura actual de varios puntos (lat, lon) en una sola llamada a Open-Meteo"""
+    params = {
+        'current': f'wind_speed_{ROUTE_WIND_LEVEL},wind_direction_{ROUTE_WIND_LEVEL}',
+        'timezone': 'auto'
+    }
+    data = open_meteo_points(OPEN_METEO_FORECAST_URL, points, params, timeout, session)
+
+    return [
+        (location['current'][f'wind_speed_{ROUTE_WIND_LEVEL}'],
+         location['current'][f'wind_direction_{ROUTE_WIND_LEVEL}'])
+        for location in data
+    ]
+
+
+def get_route_winds(mid_lat, mid_lon, deadline=None):
+    """Viento en altura en los puntos medios de los tramos (None si no se puede obtener)"""
+    if weather_grid.is_ready():
+        winds = weather_grid.upper_winds(mid_lat, mid_lon)
+        if winds is not None:
+            return winds
+
+    deadline = WEATHER_REQUEST_DEADLINE if deadline is None else deadline
+    keys = [route_wind_key(lat, lon) for lat, lon in zip(mid_lat.tolist(), mid_lon.tolist())]
+
+    winds = {}
+    missing = []
+    for key in keys:
+        if key in winds:
+            continue
+        wind = route_wind_cache.get(key)
+        if wind is not None:
+            winds[key] = wind
+        elif key not in missing:
+            missing.append(key)
+
+    # Una llamada multi-ubicación (por lotes) para todos los puntos sin datos
+    def fetch(batch, timeout, session):
+        return fetch_upper_winds_bulk([(key[2], key[3]) for key in batch], timeout, session)
+
+    for batch, fetched in fetch_in_batches(fetch, missing, deadline):
+        if fetched is None:
+            print(f"❌ No se pudo obtener el viento en altura de {len(batch)} puntos de la ruta")
+            return None
+        for key, wind in zip(batch, fetched):
+            route_wind_cache.set(key, wind)
+            winds[key] = wind
+
+    if any(key not in winds or None in winds[key] for key in keys):
+        return None
+    speed = np.array([winds[key][0] for key in keys], dtype=np.float64)
+    direction = np.array([winds[key][1] for key in keys], dtype=np.float64)
+    return speed, direction
+
+
+def calculate_route_duration(origin_airport, dest_airport, origin_weather, dest_weather,
+                             aircraft_type='medium_haul', taxi_out=None, taxi_in=None, segments=ROUTE_SEGMENTS):
+    """Duración integrando el viento en altura tramo a tramo sobre la ortodrómica
+
+    Devuelve (duración en minutos, fases, detalle de la ruta) o None si no hay datos de viento.
+    """
+    lat, lon = great_circle_waypoints(origin_airport['latitude_deg'], origin_airport['longitude_deg'],
+                                      dest_airport['latitude_deg'], dest_airport['longitude_deg'], segments)
+    lengths, bearings, mid_lat, mid_lon = segment_geometry(lat, lon)
+    winds = get_route_winds(mid_lat, mid_lon)
+    if winds is None:
+        return None
+
+    wind_speed, wind_direction = winds
+    cruise_speed = aircraft_catalogue.value('cruise_speed_kmh', aircraft_type)
+    flight_time = float(integrate_route_time(lengths, bearings, wind_speed, wind_direction, cruise_speed))
+    still_air_time = float(lengths.sum()) / cruise_speed * 60
+
+    # El viento integrado sustituye al efecto del viento de superficie en las fases en el aire
+    wind_effect = flight_time / still_air_time if still_air_time else 1.0
+    total_duration, phases = calculate_flight_phases(float(lengths.sum()), origin_weather, dest_weather,
+                                                     aircraft_type, taxi_out, taxi_in, wind_effect)
+
+    tailwind = tailwind_component(wind_speed, wind_direction, bearings)
+    route = {
+        'segments': int(len(lengths)),
+        'wind_level': ROUTE_WIND_LEVEL,
+        'avg_tailwind_kmh': round(float(np.average(tailwind, weights=lengths)), 1) if lengths.sum() else 0.0,
+        'wind_effect': round(wind_effect, 4)
+    }
+    return round(total_duration, 2), phases, route
+
+
+# Rejilla de clima sobre Europa (interpolación bilineal en memoria)
+WEATHER_GRID_ENABLED = os.environ.get('WEATHER_GRID_ENABLED', '0') == '1'
+WEATHER_GRID_BOUNDS = tuple(float(v) for v in os.environ.get('WEATHER_GRID_BOUNDS', '34,-25,72,45').split(','))
+WEATHER_GRID_STEP = float(os.environ.get('WEATHER_GRID_STEP', 2.0))  # grados
+WEATHER_GRID_REFRESH_INTERVAL = float(os.environ.get('WEATHER_GRID_REFRESH_INTERVAL', 900))  # segundos
+
+
+def wind_components(speed, direction):
+    """Componentes (u, v) del viento; la dirección indica de dónde sopla"""
+    direction = np.radians(direction)
+    return -np.asarray(speed) * np.sin(direction), -np.asarray(speed) * np.cos(direction)
+
+
+def wind_from_components(u, v):
+    """Velocidad y dirección meteorológica a partir de las componentes (u, v)"""
+    return np.hypot(u, v), np.degrees(np.arctan2(-u, -v)) % 360
+
+
+def fetch_grid_points(points):
+    """Clima de superficie y viento en altura de varios puntos en una sola llamada a Open-Meteo"""
+    variables = ['temperature_2m', 'wind_speed_10m', 'wind_direction_10m',
+                 f'wind_speed_{ROUTE_WIND_LEVEL}', f'wind_direction_{ROUTE_WIND_LEVEL}']
+    params = {
+        'current': ','.join(variables),
+        'timezone': 'auto'
+    }
+    data = open_meteo_points(OPEN_METEO_FORECAST_URL, points, params)
+
+    # Los valores ausentes quedan como NaN y esos puntos no se interpolan
+    return np.array([[location['current'].get(name) for name in variables] for location in data],
+                    dtype=np.float64)
+
+
+class WeatherGrid(BackgroundRefresher):
+    """Rejilla lat/lon de clima actual con interpolación bilineal
+
+    Todas las variables se descargan juntas por lotes y se sustituyen de una vez,
+    de modo que las consultas nunca mezclan datos de dos refrescos distintos.
+    """
+
+    thread_name = 'weather-grid'
+    description = '🗺️ Refresco de la rejilla de clima'
+    fields = ('temperature', 'u10', 'v10', 'u_upper', 'v_upper')
+
+    def __init__(self, bounds=WEATHER_GRID_BOUNDS, step=WEATHER_GRID_STEP,
+                 interval=WEATHER_GRID_REFRESH_INTERVAL, retry_delay=WEATHER_REFRESH_RETRY_DELAY,
+                 batch_size=WEATHER_BATCH_SIZE):
+        super().__init__(interval, retry_delay)
+        lat_min, lon_min, lat_max, lon_max = bounds
+        self.bounds = bounds
+        self.step = step
+        self.lat_axis = np.arange(lat_min, lat_max + step / 2, step)
+        self.lon_axis = np.arange(lon_min, lon_max + step / 2, step)
+        self.batch_size = batch_size
+        self._grid = None  # (instante monotónico, {campo: array 2D})
+
+    @property
+    def shape(self):
+        return len(self.lat_axis), len(self.lon_axis)
+
+    def refresh(self):
+        """Descarga todos los puntos de la rejilla; solo se publica si no falta ningún lote"""
+        grid_lat, grid_lon = np.meshgrid(self.lat_axis, self.lon_axis, indexing='ij')
+        points = list(zip(np.round(grid_lat.ravel(), 4).tolist(), np.round(grid_lon.ravel(), 4).tolist()))
+        try:
+            values = np.concatenate([fetch_grid_points(points[start:start + self.batch_size])
+                                     for start in range(0, len(points), self.batch_size)])
+        except Exception as e:
+            print(f"❌ Error refrescando la rejilla de clima ({len(points)} puntos): {e}")
+            self.last_error = str(e)
+            self.failure_count += 1
+            return False
+
+        temperature, speed, direction, upper_speed, upper_direction = values.T
+        u10, v10 = wind_components(speed, direction)
+        u_upper, v_upper = wind_components(upper_speed, upper_direction)
+        self._grid = (time.monotonic(), {
+            name: array.reshape(self.shape)
+            for name, array in zip(self.fields, (temperature, u10, v10, u_upper, v_upper))
+        })
+        self.last_refresh = datetime.now()
+        self.last_error = None
+        self.refresh_count += 1
+        return True
+
+    def is_ready(self):
+        grid = self._grid
+        return grid is not None and time.monotonic() - grid[0] <= WEATHER_MAX_STALENESS
+
+    def interpolate(self, lat, lon):
+        """Interpolación bilineal de todos los campos en los puntos dados
+
+        Devuelve {campo: array} con NaN fuera de la rejilla, o None si no hay datos vigentes.
+        """
+        if not self.is_ready():
+            return None
+        arrays = self._grid[1]
+        n_lat, n_lon = self.shape
+        fi = (np.asarray(lat, dtype=np.float64) - self.lat_axis[0]) / self.step
+        fj = (np.asarray(lon, dtype=np.float64) - self.lon_axis[0]) / self.step
+        inside = (fi >= 0) & (fi <= n_lat - 1) & (fj >= 0) & (fj <= n_lon - 1)
+
+        i0 = np.clip(np.floor(fi).astype(np.int64), 0, n_lat - 2)
+        j0 = np.clip(np.floor(fj).astype(np.int64), 0, n_lon - 2)
+        t = np.clip(fi - i0, 0.0, 1.0)
+        u = np.clip(fj - j0, 0.0, 1.0)
+
+        values = {}
+        for name, a in arrays.items():
+            value = ((1 - t) * (1 - u) * a[i0, j0] + (1 - t) * u * a[i0, j0 + 1]
+                     + t * (1 - u) * a[i0 + 1, j0] + t * u * a[i0 + 1, j0 + 1])
+            values[name] = np.where(inside, value, np.nan)
+        return values
+
+    def weather_at(self, lat, lon):
+        """Clima de superficie interpolado en varios puntos (None en los puntos sin datos)"""
+        values = self.interpolate(lat, lon)
+        if values is None:
+            return [None] * len(lat)
+        speed, direction = wind_from_components(values['u10'], values['v10'])
+        results = []
+        for temperature, ws, wd in zip(values['temperature'].tolist(), speed.tolist(), direction.tolist()):
+            if math.isnan(temperature) or math.isnan(ws):
+                results.append(None)
+            else:
+                results.append({'temperature': round(temperature, 1), 'wind_speed': round(ws, 1),
+                                'wind_direction': round(wd)})
+        return results
+
+    def upper_winds(self, lat, lon):
+        """Viento en altura interpolado (velocidad, dirección) o None si falta algún punto"""
+        values = self.interpolate(lat, lon)
+        if values is None:
+            return None
+        speed, direction = wind_from_components(values['u_upper'], values['v_upper'])
+        if np.isnan(speed).any():
+            return None
+        return speed, direction
+
+    def status(self):
+        return {
+            'enabled': WEATHER_GRID_ENABLED,
+            'running': self.is_alive(),
+            'ready': self.is_ready(),
+            'bounds': list(self.bounds),
+            'step_deg': self.step,
+            'points': int(np.prod(self.shape)),
+            'interval_seconds': self.interval,
+            'last_refresh': self.last_refresh.strftime('%Y-%m-%d %H:%M:%S') if self.last_refresh else None,
+            'last_error': self.last_error,
+            'refresh_count': self.refresh_count,
+            'failure_count': self.failure_count
+        }
+
+
+weather_grid = WeatherGrid()
+
+
+def json_payload(data):
+    """Serializar con la misma configuración que jsonify"""
+    return Payload(app.json.dumps(data))
+
+
+def payload_response(payload):
+    """Respuesta con ETag que devuelve 304 si el cliente ya tiene la misma versión"""
+    encoding, body, etag = payload.variant(request.accept_encodings)
+    response = app.response_class(body, mimetype=payload.mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if payload.encoded:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    # Los datos pueden cambiar al recargar aeropuertos: se revalida siempre con el ETag
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response.make_conditional(request)
+
+
+# Respuestas que no dependen del dataset (la plantilla no tiene variables)
+static_payloads = PayloadCache()
+
+
 @app.route('/')
 def index():
-    """Página principal con el mapa"""
-    return render_template_string(HTML_TEMPLATE)
+    """Página principal con el mapa (renderizada y comprimida una sola vez)"""
+    payload = static_payloads.get_or_build(
+        'index', lambda: Payload(render_template_string(HTML_TEMPLATE), mimetype='text/html'))
+    return payload_response(payload)
+
+
+AIRPORTS_PAGE_SIZE = int(os.environ.get('AIRPORTS_PAGE_SIZE', 500))
+AIRPORTS_MAX_PAGE_SIZE = int(os.environ.get('AIRPORTS_MAX_PAGE_SIZE', 5000))
+AIRPORTS_QUERY_ARGS = ('bbox', 'zoom', 'fields', 'cursor', 'limit', 'format')
+
+
+def parse_bbox(value):
+    """'oeste,sur,este,norte' -> tupla redondeada hacia fuera (mejora los aciertos de caché)"""
+    west, south, east, north = (float(part) for part in value.split(','))
+    if not (-90 <= south <= north <= 90) or not (-180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError(value)
+    return (math.floor(west * 100) / 100, math.floor(south * 100) / 100,
+            math.ceil(east * 100) / 100, math.ceil(north * 100) / 100)
 
 
 @app.route('/api/airports')
 def get_airports():
-    """API para obtener lista de aeropuertos"""
-    airports = airports_df.to_dict('records')
-    return jsonify(airports)
+    """API para obtener lista de aeropuertos
+
+    Sin parámetros devuelve la lista completa. Admite bbox=oeste,sur,este,norte, zoom,
+    fields=campo1,campo2, cursor + limit para paginar y format=compact (columnas + filas).
+    """
+    airports = get_airport_data()
+    if not any(arg in request.args for arg in AIRPORTS_QUERY_ARGS):
+        return payload_response(airports.payloads.get_or_build('all', lambda: json_payload(airports.records)))
+
+    try:
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        zoom = int(request.args['zoom']) if request.args.get('zoom') else None
+        limit = int(request.args.get('limit', AIRPORTS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Parámetros no válidos'}), 400
+    limit = max(1, min(limit, AIRPORTS_MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor') or None
+    compact = request.args.get('format') == 'compact'
+
+    all_fields = list(airports.df.columns)
+    fields = [field for field in request.args.get('fields', '').split(',') if field in all_fields] or all_fields
+    if 'iata_code' not in fields:
+        fields.insert(0, 'iata_code')
+
+    def build():
+        positions, next_cursor, total = airports.query(bbox, zoom, cursor, limit)
+        records = [airports.sorted_records[position] for position in positions.tolist()]
+        if compact:
+            data = {'fields': fields, 'rows': [[record.get(field) for field in fields] for record in records]}
+        else:
+            data = {'airports': [{field: record.get(field) for field in fields} for record in records]}
+        data.update({'count': len(records), 'total': total, 'next_cursor': next_cursor})
+        return json_payload(data)
+
+    key = (bbox, zoom, tuple(fields), cursor, limit, compact)
+    return payload_response(airports.payloads.get_or_build(key, build))
+
+
+SPATIAL_MAX_RESULTS = int(os.environ.get('SPATIAL_MAX_RESULTS', 500))
+
+
+def parse_point_args():
+    """Leer lat/lon de la query string; devuelve (lat, lon) o None si no son válidos"""
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None or not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def spatial_results(airports, positions, distances):
+    """Registros de aeropuertos con la distancia al punto consultado"""
+    return [
+        dict(airports.row_records[position], distance_km=round(float(distance), 2))
+        for position, distance in zip(positions.tolist(), distances.tolist())
+    ]
+
+
+@app.route('/api/airports/clusters/<int:zoom>/<int:x>/<int:y>')
+def get_airport_clusters(zoom, x, y):
+    """API de grupos de aeropuertos de una tesela z/x/y del mapa"""
+    if zoom > CLUSTER_MAX_ZOOM or x >= 2 ** zoom or y >= 2 ** zoom:
+        return jsonify({'error': 'Tesela no válida'}), 400
+
+    airports = get_airport_data()
+    payload = airports.payloads.get_or_build(
+        ('clusters', zoom, x, y), lambda: json_payload(airports.clusters(zoom).tile(x, y)))
+    return payload_response(payload)
+
+
+@app.route('/api/airports/nearest')
+def get_nearest_airports():
+    """API para obtener los aeropuertos más cercanos a un punto (lat, lon, k)"""
+    point = parse_point_args()
+    if point is None:
+        return jsonify({'error': 'Coordenadas no válidas'}), 400
+    k = max(1, min(request.args.get('k', 1, type=int), SPATIAL_MAX_RESULTS))
+
+    airports = get_airport_data()
+    positions, distances = airports.spatial.nearest(point[0], point[1], k)
+    return jsonify(spatial_results(airports, positions, distances))
+
+
+@app.route('/api/airports/within')
+def get_airports_within():
+    """API para obtener los aeropuertos dentro de un radio en km alrededor de un punto"""
+    point = parse_point_args()
+    radius_km = request.args.get('radius_km', type=float)
+    if point is None or radius_km is None or radius_km < 0:
+        return jsonify({'error': 'Parámetros no válidos'}), 400
+    limit = max(1, min(request.args.get('limit', SPATIAL_MAX_RESULTS, type=int), SPATIAL_MAX_RESULTS))
+
+    airports = get_airport_data()
+    positions, distances = airports.spatial.within(point[0], point[1], radius_km)
+    return jsonify({
+        'count': int(len(positions)),
+        'airports': spatial_results(airports, positions[:limit], distances[:limit])
+    })
+
+
+@app.route('/api/ready')
+def get_readiness():
+    """API de disponibilidad: indica qué dataset de aeropuertos está activo"""
+    get_airport_data()
+    return jsonify(airport_data.status())
+
+
+@app.route('/api/aircraft')
+def get_aircraft():
+    """API con el catálogo de rendimiento de aeronaves"""
+    payload = static_payloads.get_or_build('aircraft', lambda: json_payload({
+        'aircraft': aircraft_catalogue.records(),
+        'default': DEFAULT_AIRCRAFT_TYPE
+    }))
+    return payload_response(payload)
 
 
 @app.route('/api/calculate', methods=['POST'])
@@ -856,28 +3180,79 @@ def calculate_flight():
     origin_iata = data.get('origin')
     dest_iata = data.get('destination')
     aircraft_type = data.get('aircraft_type', 'medium_haul')
+    wind_model = data.get('wind_model', 'surface')  # 'surface' o 'route'
+    departure_time = data.get('departure_time')  # opcional: ISO 8601 o segundos Unix
+
+    if departure_time is not None:
+        try:
+            departure_time = parse_departure_time(departure_time)
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({'error': 'departure_time debe ser una fecha ISO 8601 o segundos Unix'}), 400
+    if not isinstance(aircraft_type, str):
+        return jsonify({'error': 'aircraft_type debe ser un texto'}), 400
 
     # Buscar aeropuertos
-    origin_airport = airports_df[airports_df['iata_code'] == origin_iata]
-    dest_airport = airports_df[airports_df['iata_code'] == dest_iata]
+    airports = get_airport_data()
+    origin_airport = airports.find_airport(origin_iata)
+    dest_airport = airports.find_airport(dest_iata)
 
-    if origin_airport.empty or dest_airport.empty:
+    if origin_airport is None or dest_airport is None:
         return jsonify({'error': 'Aeropuertos no encontrados'})
 
-    origin_airport = origin_airport.iloc[0]
-    dest_airport = dest_airport.iloc[0]
-
-    # Calcular distancia
-    coord1 = (origin_airport['latitude_deg'], origin_airport['longitude_deg'])
-    coord2 = (dest_airport['latitude_deg'], dest_airport['longitude_deg'])
-    distance = haversine_distance(coord1, coord2)
-
-    # Obtener clima actual
-    origin_weather = get_current_weather(origin_airport)
-    dest_weather = get_current_weather(dest_airport)
-
-    # Calcular duración
-    duration = calculate_improved_duration(distance, origin_weather, dest_weather, aircraft_type)
+    # Calcular distancia (lectura de la matriz precalculada)
+    distance = airports.distances.distance(origin_airport['iata_code'], dest_airport['iata_code'])
+    taxi_out, taxi_in = taxi_times.for_route(origin_airport['iata_code'], dest_airport['iata_code'])
+
+    weather_source = 'current'
+    forecasts = None
+    if departure_time is not None:
+        # Previsión horaria de ambos aeropuertos con una sola llamada (o desde la caché)
+        forecasts = get_forecasts([origin_airport, dest_airport])
+        origin_forecast = forecasts[weather_cache_key(origin_airport)]
+        dest_forecast = forecasts[weather_cache_key(dest_airport)]
+        if origin_forecast is None or dest_forecast is None:
+            forecasts = None
+        else:
+            origin_weather = origin_forecast.at(departure_time)
+            dest_weather = dest_forecast.at(departure_time)
+            if origin_weather is None or dest_weather is None:
+                return jsonify({'error': f'departure_time fuera del horizonte de previsión ({FORECAST_DAYS} días)'}), 400
+            weather_source = 'forecast'
+
+    if forecasts is None:
+        # Obtener clima actual de ambos aeropuertos en paralelo
+        (origin_weather, dest_weather), defaulted = get_weather_for_airports([origin_airport, dest_airport])
+        if defaulted:
+            weather_source = 'default'
+
+    # Calcular duración (con viento en altura a lo largo de la ruta si se pide y hay datos)
+    route = None
+    if wind_model == 'route':
+        route_result = calculate_route_duration(origin_airport, dest_airport, origin_weather,
+                                                dest_weather, aircraft_type, taxi_out, taxi_in)
+        if route_result is not None:
+            duration, phases, route = route_result
+    if route is None:
+        wind_model = 'surface'
+        duration, phases = calculate_flight_phases(distance, origin_weather, dest_weather, aircraft_type,
+                                                   taxi_out, taxi_in)
+        duration = round(duration, 2)
+
+    if weather_source == 'forecast':
+        # El clima de destino se toma a la hora estimada de llegada y se recalcula una vez
+        arrival_weather = dest_forecast.at(departure_time + int(duration * 60))
+        if arrival_weather is not None and arrival_weather != dest_weather:
+            dest_weather = arrival_weather
+            route_result = None
+            if route is not None:
+                route_result = calculate_route_duration(origin_airport, dest_airport, origin_weather,
+                                                        dest_weather, aircraft_type, taxi_out, taxi_in)
+            if route_result is not None:
+                duration, phases, route = route_result
+            else:
+                duration, phases = calculate_flight_phases(distance, origin_weather, dest_weather,
+                                                           aircraft_type, taxi_out, taxi_in)
+                duration = round(duration, 2)
 
     # Preparar respuesta
     response = {
@@ -895,8 +3270,181 @@ def calculate_flight():
         },
         'distance_km': round(distance, 2),
         'duration_min': duration,
+        'phases': phases,
+        'wind_model': wind_model,
+        'weather_source': weather_source,
+        'calculation_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    if route is not None:
+        response['route'] = route
+    warning = aircraft_catalogue.unknown_warning(aircraft_type)
+    if warning is not None:
+        response['warning'] = warning
+    if departure_time is not None:
+        response['departure_time'] = format_timestamp(departure_time)
+        response['arrival_time'] = format_timestamp(departure_time + int(duration * 60))
+
+    return jsonify(response)
+
+
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 10000))
+
+
+def parse_batch_item(item):
+    """Normalizar un elemento del lote: [origen, destino, tipo] o {'origin', 'destination', 'aircraft_type'}"""
+    if isinstance(item, dict):
+        return item.get('origin'), item.get('destination'), item.get('aircraft_type', 'medium_haul')
+    if isinstance(item, (list, tuple)) and 2 <= len(item) <= 3:
+        aircraft_type = item[2] if len(item) == 3 else 'medium_haul'
+        return item[0], item[1], aircraft_type
+    return None, None, None
+
+
+@app.route('/api/calculate/batch', methods=['POST'])
+def calculate_flight_batch():
+    """API para calcular la duración de muchos vuelos en una sola petición"""
+    data = request.get_json(silent=True) or {}
+    items = data.get('flights') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return jsonify({'error': 'Se esperaba una lista de vuelos en "flights"'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'Máximo {BATCH_MAX_ITEMS} vuelos por petición'}), 400
+
+    # Resolver aeropuertos y separar los elementos con errores
+    airport_set = get_airport_data()
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        origin_code, dest_code, aircraft_type = parse_batch_item(item)
+        origin_airport = airport_set.find_airport(origin_code)
+        dest_airport = airport_set.find_airport(dest_code)
+        if origin_airport is None or dest_airport is None:
+            results[i] = {'index': i, 'error': 'Aeropuertos no encontrados'}
+        elif not isinstance(aircraft_type, str):
+            results[i] = {'index': i, 'error': 'aircraft_type debe ser un texto'}
+        else:
+            valid.append((i, origin_airport, dest_airport, aircraft_type))
+
+    # Clima: una sola consulta por aeropuerto distinto
+    airports = {}
+    for _, origin_airport, dest_airport, _ in valid:
+        airports.setdefault(origin_airport['iata_code'], origin_airport)
+        airports.setdefault(dest_airport['iata_code'], dest_airport)
+    weather, defaulted = get_weather_bulk(list(airports.values()))
+
+    # Distancias de todos los pares en una sola operación vectorizada
+    origin_idx = airport_set.distances.indices([v[1]['iata_code'] for v in valid])
+    dest_idx = airport_set.distances.indices([v[2]['iata_code'] for v in valid])
+    distances = airport_set.distances.pair_distances(origin_idx, dest_idx) if valid else []
+
+    # Duraciones de todos los vuelos en una sola pasada vectorizada
+    origin_temp, origin_wind_speed, origin_wind_dir = weather_columns(
+        [weather[weather_cache_key(v[1])] for v in valid])
+    dest_temp, dest_wind_speed, dest_wind_dir = weather_columns(
+        [weather[weather_cache_key(v[2])] for v in valid])
+    taxi_out, taxi_in = taxi_times.columns([v[1]['iata_code'] for v in valid], [v[2]['iata_code'] for v in valid])
+    durations = calculate_improved_duration_array(
+        distances, origin_wind_speed, dest_wind_speed, origin_wind_dir, dest_wind_dir,
+        origin_temp, dest_temp, [v[3] for v in valid], taxi_out, taxi_in)
+
+    for (i, origin_airport, dest_airport, aircraft_type), distance, duration in zip(valid, distances, durations):
+        results[i] = {
+            'index': i,
+            'origin': origin_airport['iata_code'],
+            'destination': dest_airport['iata_code'],
+            'aircraft_type': aircraft_type,
+            'distance_km': round(float(distance), 2),
+            'duration_min': float(duration),
+            'weather_source': 'default' if {weather_cache_key(origin_airport),
+                                             weather_cache_key(dest_airport)} & defaulted else 'current'
+        }
+        warning = aircraft_catalogue.unknown_warning(aircraft_type)
+        if warning is not None:
+            results[i]['warning'] = warning
+
+    return jsonify({
+        'results': results,
+        'count': len(results),
+        'errors': len(results) - len(valid),
+        'weather': {code: weather[weather_cache_key(airport)] for code, airport in airports.items()},
+        'calculation_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+
+SWEEP_DEFAULT_HOURS = int(os.environ.get('SWEEP_DEFAULT_HOURS', 48))
+
+
+@app.route('/api/calculate/sweep', methods=['POST'])
+def calculate_flight_sweep():
+    """API para estimar la duración de un vuelo para cada hora de salida de una ventana"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Se esperaba un objeto JSON'}), 400
+    aircraft_type = data.get('aircraft_type', 'medium_haul')
+
+    try:
+        start = parse_departure_time(data['start']) if data.get('start') is not None else int(time.time())
+        hours = int(data.get('hours', SWEEP_DEFAULT_HOURS))
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({'error': 'start debe ser una fecha ISO 8601 o segundos Unix y hours un entero'}), 400
+    if not 1 <= hours <= FORECAST_DAYS * 24:
+        return jsonify({'error': f'hours debe estar entre 1 y {FORECAST_DAYS * 24}'}), 400
+    if not isinstance(aircraft_type, str):
+        return jsonify({'error': 'aircraft_type debe ser un texto'}), 400
+
+    airports = get_airport_data()
+    origin_airport = airports.find_airport(data.get('origin'))
+    dest_airport = airports.find_airport(data.get('destination'))
+    if origin_airport is None or dest_airport is None:
+        return jsonify({'error': 'Aeropuertos no encontrados'})
+
+    forecasts = get_forecasts([origin_airport, dest_airport])
+    origin_forecast = forecasts[weather_cache_key(origin_airport)]
+    dest_forecast = forecasts[weather_cache_key(dest_airport)]
+    if origin_forecast is None or dest_forecast is None:
+        return jsonify({'error': 'Previsión horaria no disponible'}), 503
+
+    # Una salida por hora en punto dentro de la ventana y del horizonte de previsión
+    first_hour = -(-start // HOUR_SECONDS) * HOUR_SECONDS
+    departures = first_hour + np.arange(hours, dtype=np.int64) * HOUR_SECONDS
+    # Igual que HourlyForecast.at(): se descartan las horas fuera del horizonte o con algún dato nulo
+    complete = np.ones(len(departures), dtype=bool)
+    for column in origin_forecast.columns(departures) + dest_forecast.columns(departures):
+        complete &= ~np.isnan(column)
+    departures = departures[complete]
+
+    distance = airports.distances.distance(origin_airport['iata_code'], dest_airport['iata_code'])
+    taxi_out, taxi_in = taxi_times.for_route(origin_airport['iata_code'], dest_airport['iata_code'])
+    durations = calculate_durations_at_times(
+        np.full(len(departures), distance), departures, origin_forecast.columns(departures),
+        dest_forecast.columns, aircraft_type, taxi_out, taxi_in)
+    departures, durations = departures[~np.isnan(durations)], durations[~np.isnan(durations)]
+    if not len(departures):
+        return jsonify({'error': f'Ventana fuera del horizonte de previsión ({FORECAST_DAYS} días)'}), 400
+
+    series = [
+        {
+            'departure_time': format_timestamp(departure),
+            'arrival_time': format_timestamp(departure + int(duration * 60)),
+            'duration_min': duration
+        }
+        for departure, duration in zip(departures.tolist(), durations.tolist())
+    ]
+    best = int(np.nanargmin(durations))
+
+    response = {
+        'origin': origin_airport['iata_code'],
+        'destination': dest_airport['iata_code'],
+        'aircraft_type': aircraft_type,
+        'distance_km': round(distance, 2),
+        'series': series,
+        'count': len(series),
+        'best': series[best],
         'calculation_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
+    warning = aircraft_catalogue.unknown_warning(aircraft_type)
+    if warning is not None:
+        response['warning'] = warning
 
     return jsonify(response)
 
@@ -904,25 +3452,443 @@ def calculate_flight():
 @app.route('/api/weather/<iata_code>')
 def get_airport_weather(iata_code):
     """API para obtener clima de un aeropuerto específico"""
-    airport = airports_df[airports_df['iata_code'] == iata_code]
-    if airport.empty:
+    airport = find_airport(iata_code)
+    if airport is None:
         return jsonify({'error': 'Aeropuerto no encontrado'})
 
-    airport = airport.iloc[0]
-    weather = get_current_weather(airport)
+    (weather,), defaulted = get_weather_for_airports([airport])
 
     return jsonify({
-        'iata': iata_code,
+        'iata': airport['iata_code'],
         'name': airport['name'],
-        'weather': weather
+        'weather': weather,
+        'weather_source': 'default' if defaulted else 'current'
     })
 
 
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """API para consultar las estadísticas de la caché de clima"""
+    return jsonify({
+        'weather': weather_cache.stats(),
+        'route_winds': route_wind_cache.stats(),
+        'prefetcher': weather_prefetcher.status(),
+        'grid': weather_grid.status()
+    })
+
+
+@app.route('/api/distance/<origin_iata>/<dest_iata>')
+def get_distance(origin_iata, dest_iata):
+    """API para obtener la distancia entre dos aeropuertos"""
+    airports = get_airport_data()
+    origin_airport = airports.find_airport(origin_iata)
+    dest_airport = airports.find_airport(dest_iata)
+    if origin_airport is None or dest_airport is None:
+        return jsonify({'error': 'Aeropuertos no encontrados'})
+
+    distance = airports.distances.distance(origin_airport['iata_code'], dest_airport['iata_code'])
+    return jsonify({
+        'origin': origin_airport['iata_code'],
+        'destination': dest_airport['iata_code'],
+        'distance_km': round(distance, 2)
+    })
+
+
+@app.cli.command('refresh-airports')
+def refresh_airports():
+    """Descarga de nuevo la tabla de aeropuertos y actualiza la caché local"""
+    airports = airport_data.load_now(force_refresh=True)
+    if airports.source != 'download':
+        raise SystemExit("❌ No se pudo actualizar la caché de aeropuertos")
+    print(f"✅ Caché de aeropuertos actualizada: {len(airports)} aeropuertos en {AIRPORTS_CACHE_PATH}")
+
+
+@app.cli.command('benchmark-ingestion')
+@click.argument('source', default=AIRPORTS_URL)
+def benchmark_ingestion(source):
+    """Compara tiempo y memoria pico de la lectura completa frente a la lectura por bloques"""
+    import tracemalloc
+
+    def measure(read):
+        tracemalloc.start()
+        start = time.perf_counter()
+        df = read()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return df, elapsed, peak
+
+    full, full_time, full_peak = measure(lambda: filter_airports(
+        pd.read_csv(source, keep_default_na=False, na_values=[''])))
+    pruned, pruned_time, pruned_peak = measure(lambda: filter_airports(read_airports_csv(source)))
+
+    print(f"📊 Aeropuertos seleccionados: {len(full)} (completo) / {len(pruned)} (por bloques)")
+    print(f"🐢 Lectura completa:   {full_time * 1000:8.1f} ms | pico {full_peak / 2 ** 20:7.1f} MiB")
+    print(f"🚀 Lectura por bloques: {pruned_time * 1000:8.1f} ms | pico {pruned_peak / 2 ** 20:7.1f} MiB")
+
+
+@app.cli.command('check-model-parity')
+@click.option('--samples', default=100000, show_default=True, help='Número de casos aleatorios')
+@click.option('--seed', default=0, show_default=True)
+def check_model_parity(samples, seed):
+    """Comprueba que el modelo vectorizado da exactamente los mismos resultados que el escalar"""
+    rng = np.random.default_rng(seed)
+    distance = rng.uniform(50, 5000, samples)
+    origin_wind_speed = np.round(rng.uniform(0, 80, samples), 1)
+    dest_wind_speed = np.round(rng.uniform(0, 80, samples), 1)
+    origin_wind_dir = rng.integers(0, 361, samples).astype(np.float64)
+    dest_wind_dir = rng.integers(0, 361, samples).astype(np.float64)
+    origin_temp = np.round(rng.uniform(-25, 45, samples), 1)
+    dest_temp = np.round(rng.uniform(-25, 45, samples), 1)
+    aircraft_types = rng.choice(aircraft_catalogue.codes + ['unknown'], samples)
+    airport_codes = list(taxi_times.times) + ['XXX']
+    origin_codes = rng.choice(airport_codes, samples)
+    dest_codes = rng.choice(airport_codes, samples)
+
+    start = time.perf_counter()
+    taxi_out, taxi_in = taxi_times.columns(origin_codes, dest_codes)
+    vectorized = calculate_improved_duration_array(distance, origin_wind_speed, dest_wind_speed,
+                                                   origin_wind_dir, dest_wind_dir, origin_temp,
+                                                   dest_temp, aircraft_types, taxi_out, taxi_in)
+    vectorized_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scalar = np.array([
+        calculate_improved_duration(
+            d,
+            {'temperature': ot, 'wind_speed': ows, 'wind_direction': owd},
+            {'temperature': dt, 'wind_speed': dws, 'wind_direction': dwd},
+            t,
+            *taxi_times.for_route(o, de)
+        )
+        for d, ows, dws, owd, dwd, ot, dt, t, o, de in zip(
+            distance.tolist(), origin_wind_speed.tolist(), dest_wind_speed.tolist(),
+            origin_wind_dir.tolist(), dest_wind_dir.tolist(), origin_temp.tolist(),
+            dest_temp.tolist(), aircraft_types.tolist(), origin_codes.tolist(), dest_codes.tolist())
+    ])
+    scalar_time = time.perf_counter() - start
+
+    mismatches = int(np.count_nonzero(vectorized != scalar))
+    print(f"📊 Casos: {samples} | Diferencias: {mismatches}")
+    print(f"🐢 Escalar:     {scalar_time * 1000:.1f} ms")
+    print(f"🚀 Vectorizado: {vectorized_time * 1000:.1f} ms")
+    if mismatches:
+        raise SystemExit(f"❌ El modelo vectorizado difiere del escalar en {mismatches} casos")
+    print("✅ Paridad exacta entre el modelo escalar y el vectorizado")
+
+
+@app.cli.command('backfill-weather')
+@click.option('--start', required=True, help='Primer día (AAAA-MM-DD)')
+@click.option('--end', required=True, help='Último día incluido (AAAA-MM-DD)')
+@click.option('--replay', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='CSV local (iata_code,time,temperature,wind_speed,wind_direction) en lugar de la API')
+@click.option('--chunksize', default=200000, show_default=True, help='Filas por bloque del CSV local')
+def backfill_weather(start, end, replay, chunksize):
+    """Descarga (o reproduce) el clima horario histórico de todos los aeropuertos a particiones mensuales"""
+    first_day, last_day = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+    if last_day < first_day:
+        raise click.BadParameter('--end debe ser posterior a --start')
+    start_ts = int(first_day.astype('datetime64[s]').astype(np.int64))
+    end_ts = int((last_day + 1).astype('datetime64[s]').astype(np.int64))
+    started = time.perf_counter()
+    stored = 0
+
+    if replay:
+        # El fichero se lee por bloques y cada bloque se reparte entre sus meses
+        for chunk in pd.read_csv(replay, chunksize=chunksize,
+                                 usecols=['iata_code', 'time'] + list(WEATHER_HISTORY_FIELDS)):
+            timestamps, valid = parse_time_column(chunk['time'])
+            timestamps = timestamps // HOUR_SECONDS * HOUR_SECONDS
+            valid &= (timestamps >= start_ts) & (timestamps < end_ts)
+            codes = normalize_codes(chunk['iata_code'])
+            months = timestamp_months(timestamps)
+            chunk_months = np.unique(months[valid])
+            for month in chunk_months:
+                rows = valid & (months == month)
+                stored += weather_history.stage(
+                    str(month), codes[rows].tolist(), timestamps[rows],
+                    {field: chunk[field].to_numpy(dtype=np.float64)[rows] for field in WEATHER_HISTORY_FIELDS})
+            # Con el fichero ordenado por tiempo los meses anteriores al bloque ya están completos
+            if len(chunk_months):
+                weather_history.flush([month for month in weather_history.staged_months()
+                                       if month < chunk_months[0]])
+            print(f"📥 {stored} observaciones leídas")
+        weather_history.flush()
+    else:
+        airports = airport_data.load_now().records
+        month = first_day.astype('datetime64[M]')
+        while month <= last_day.astype('datetime64[M]'):
+            # Un mes cada vez para que la memoria no dependa del periodo
+            month_first = max(first_day, month.astype('datetime64[D]'))
+            month_last = min(last_day, (month + 1).astype('datetime64[D]') - 1)
+            for batch_start in range(0, len(airports), WEATHER_BATCH_SIZE):
+                batch = airports[batch_start:batch_start + WEATHER_BATCH_SIZE]
+                times, values = fetch_archive_bulk(batch, str(month_first), str(month_last))
+                codes = np.repeat([airport['iata_code'] for airport in batch], len(times)).tolist()
+                stored += weather_history.stage(
+                    str(month), codes, np.tile(times, len(batch)),
+                    {field: matrix.ravel() for field, matrix in values.items()})
+            weather_history.flush([str(month)])
+            print(f"📥 {month}: {len(airports)} aeropuertos, {stored} observaciones acumuladas")
+            month += 1
+
+    print(f"✅ {stored} observaciones en {weather_history.directory} "
+          f"({time.perf_counter() - started:.1f} s)")
+
+
+@app.cli.command('recompute-durations')
+@click.argument('routes', type=click.Path(exists=True, dir_okay=False))
+@click.argument('output', type=click.Path(dir_okay=False))
+@click.option('--chunksize', default=100000, show_default=True, help='Vuelos por bloque')
+def recompute_durations(routes, output, chunksize):
+    """Recalcula por bloques la duración de una lista de vuelos con el clima histórico
+
+    ROUTES es un CSV con origin, destination, departure_time y, opcionalmente, aircraft_type.
+    """
+    airports = airport_data.load_now()
+    started = time.perf_counter()
+    total = 0
+    counts = {}
+
+    for number, chunk in enumerate(pd.read_csv(routes, chunksize=chunksize)):
+        departures, valid_time = parse_time_column(chunk['departure_time'])
+        aircraft_types = chunk['aircraft_type'].fillna(DEFAULT_AIRCRAFT_TYPE).to_numpy(dtype=object) \
+            if 'aircraft_type' in chunk else DEFAULT_AIRCRAFT_TYPE
+        distances, durations, status = predict_historical_durations(
+            airports, chunk['origin'], chunk['destination'], departures, aircraft_types)
+
+        chunk['distance_km'] = round_like_python(distances, 2)
+        chunk['duration_min'] = np.where(valid_time, durations, np.nan)
+        chunk['status'] = np.where(valid_time, status, 'time')
+        chunk.to_csv(output, mode='w' if number == 0 else 'a', header=number == 0, index=False)
+
+        total += len(chunk)
+        for value, count in chunk['status'].value_counts().items():
+            counts[value] = counts.get(value, 0) + int(count)
+        print(f"🧮 {total} vuelos procesados")
+
+    summary = ', '.join(f'{status}: {count}' for status, count in sorted(counts.items()))
+    print(f"✅ {total} vuelos en {time.perf_counter() - started:.1f} s ({summary}) -> {output}")
+
+
+# Evaluación de las predicciones frente a tiempos reales de bloque
+EVALUATION_BIN_MIN = 0.5  # resolución de los percentiles (minutos)
+EVALUATION_MAX_ERROR_MIN = 600  # errores mayores se cuentan en el último intervalo
+# Por ruta hay miles de grupos: intervalos que crecen en este factor (percentiles con ±5 % de error)
+EVALUATION_ROUTE_BIN_RATIO = float(os.environ.get('EVALUATION_ROUTE_BIN_RATIO', 1.05))
+SEASONS = np.array(['invierno', 'invierno', 'primavera', 'primavera', 'primavera', 'verano',
+                    'verano', 'verano', 'otoño', 'otoño', 'otoño', 'invierno'])
+
+
+def linear_bin_edges(bin_width=EVALUATION_BIN_MIN, max_error=EVALUATION_MAX_ERROR_MIN):
+    """Límites superiores de intervalos de ancho fijo (el último recoge los errores mayores)"""
+    return np.arange(1, int(math.ceil(max_error / bin_width)) + 2) * bin_width
+
+
+def log_bin_edges(bin_width=EVALUATION_BIN_MIN, max_error=EVALUATION_MAX_ERROR_MIN,
+                  ratio=EVALUATION_ROUTE_BIN_RATIO):
+    """Límites superiores de intervalos que crecen geométricamente desde bin_width"""
+    count = int(math.ceil(math.log(max_error / bin_width) / math.log(ratio))) + 2
+    return bin_width * ratio ** np.arange(count)
+
+
+class ErrorAccumulator:
+    """Estadísticas de error por grupo acumuladas por bloques (memoria según el número de grupos)
+
+    El error absoluto se cuenta en un histograma por grupo para obtener percentiles sin
+    guardar los errores individuales. Cada grupo ocupa (intervalos + 4) x 8 bytes: ~9,6 KB
+    con los 1.201 intervalos lineales por defecto y ~1,2 KB con log_bin_edges(). La capacidad
+    se duplica al llenarse (hasta el doble de esa memoria reservada) para que añadir grupos no
+    copie los arrays en cada bloque.
+    """
+
+    def __init__(self, edges=None):
+        self.edges = linear_bin_edges() if edges is None else np.asarray(edges, dtype=np.float64)
+        self.bins = len(self.edges)
+        self.groups = {}
+        self.count = np.zeros(0, dtype=np.int64)
+        self.sum_error = np.zeros(0)
+        self.sum_abs = np.zeros(0)
+        self.sum_sq = np.zeros(0)
+        self.histogram = np.zeros((0, self.bins), dtype=np.int64)
+
+    def _grow(self, size):
+        capacity = len(self.count)
+        if size > capacity:
+            extra = max(size, 2 * capacity, 16) - capacity
+            self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+            self.sum_error = np.concatenate([self.sum_error, np.zeros(extra)])
+            self.sum_abs = np.concatenate([self.sum_abs, np.zeros(extra)])
+            self.sum_sq = np.concatenate([self.sum_sq, np.zeros(extra)])
+            self.histogram = np.vstack([self.histogram, np.zeros((extra, self.bins), dtype=np.int64)])
+
+    def update(self, keys, errors):
+        """Añadir los errores (predicción - real) de un bloque con la clave de grupo de cada fila"""
+        if not len(errors):
+            return
+        positions, unique = pd.factorize(np.asarray(keys, dtype=object), use_na_sentinel=False)
+        group_ids = np.array([self.groups.setdefault(key, len(self.groups)) for key in unique],
+                             dtype=np.int64)[positions]
+        size = len(self.groups)
+        self._grow(size)
+
+        abs_errors = np.abs(errors)
+        self.count[:size] += np.bincount(group_ids, minlength=size)
+        self.sum_error[:size] += np.bincount(group_ids, weights=errors, minlength=size)
+        self.sum_abs[:size] += np.bincount(group_ids, weights=abs_errors, minlength=size)
+        self.sum_sq[:size] += np.bincount(group_ids, weights=errors * errors, minlength=size)
+        bins = np.minimum(np.searchsorted(self.edges, abs_errors, side='right'), self.bins - 1)
+        self.histogram[:size] += np.bincount(group_ids * self.bins + bins,
+                                             minlength=size * self.bins).reshape(size, self.bins)
+
+    def percentiles(self, quantiles):
+        """Percentiles del error absoluto por grupo (límite superior del intervalo del histograma)"""
+        size = len(self.groups)
+        cumulative = np.cumsum(self.histogram[:size], axis=1)
+        return np.stack([
+            self.edges[np.argmax(cumulative >= np.ceil(q * self.count[:size])[:, None], axis=1)]
+            for q in quantiles
+        ], axis=1)
+
+    def summary(self, dimension, min_count=1):
+        """DataFrame con n, MAE, sesgo, RMSE y percentiles del error absoluto por grupo"""
+        size = len(self.groups)
+        keys = np.array(list(self.groups), dtype=object)
+        keep = self.count[:size] >= min_count
+        count = self.count[:size][keep]
+        p50, p90, p95 = np.round(self.percentiles([0.5, 0.9, 0.95])[keep], 2).T
+        return pd.DataFrame({
+            'dimension': dimension,
+            'group': keys[keep],
+            'n': count,
+            'mae_min': np.round(self.sum_abs[:size][keep] / count, 2),
+            'bias_min': np.round(self.sum_error[:size][keep] / count, 2),
+            'rmse_min': np.round(np.sqrt(self.sum_sq[:size][keep] / count), 2),
+            'p50_abs_min': p50,
+            'p90_abs_min': p90,
+            'p95_abs_min': p95
+        }).sort_values('n', ascending=False)
+
+
+def read_flight_log(path, chunksize, columns):
+    """Leer un registro de vuelos CSV o Parquet por bloques de DataFrames"""
+    if path.lower().endswith(('.parquet', '.pq')):
+        if pq is None:
+            raise click.ClickException('Leer Parquet requiere pyarrow (pip install pyarrow)')
+        parquet_file = pq.ParquetFile(path)
+        available = [column for column in columns if column in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=available):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=lambda column: column in columns)
+
+
+@app.cli.command('evaluate-predictions')
+@click.argument('log', type=click.Path(exists=True, dir_okay=False))
+@click.option('--actual-column', default='block_time_min', show_default=True,
+              help='Columna con el tiempo real de bloque en minutos')
+@click.option('--chunksize', default=200000, show_default=True, help='Vuelos por bloque')
+@click.option('--min-count', default=20, show_default=True, help='Vuelos mínimos para mostrar un grupo')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='CSV con el informe completo')
+def evaluate_predictions(log, actual_column, chunksize, min_count, output):
+    """Compara las predicciones con los tiempos reales de un registro de vuelos (CSV o Parquet)
+
+    El registro necesita origin, destination, departure_time, la columna del tiempo real y,
+    opcionalmente, aircraft_type. El clima sale del histórico de backfill-weather.
+    """
+    airports = airport_data.load_now()
+    dimensions = {name: ErrorAccumulator() for name in ('total', 'aircraft_type', 'season')}
+    dimensions['route'] = ErrorAccumulator(log_bin_edges())
+    columns = ['origin', 'destination', 'departure_time', 'aircraft_type', actual_column]
+    started = time.perf_counter()
+    total = 0
+    skipped = {}
+
+    for chunk in read_flight_log(log, chunksize, columns):
+        departures, valid_time = parse_time_column(chunk['departure_time'])
+        aircraft_types = chunk['aircraft_type'].fillna(DEFAULT_AIRCRAFT_TYPE).to_numpy(dtype=object) \
+            if 'aircraft_type' in chunk else np.full(len(chunk), DEFAULT_AIRCRAFT_TYPE, dtype=object)
+        _, predicted, status = predict_historical_durations(
+            airports, chunk['origin'], chunk['destination'], departures, aircraft_types)
+        actual = pd.to_numeric(chunk[actual_column], errors='coerce').to_numpy(dtype=np.float64)
+        status = np.where(valid_time, status, 'time')
+        status = np.where((status == 'ok') & np.isnan(actual), 'actual', status)
+
+        total += len(chunk)
+        for value, count in zip(*np.unique(status[status != 'ok'], return_counts=True)):
+            skipped[value] = skipped.get(value, 0) + int(count)
+
+        ok = status == 'ok'
+        errors = predicted[ok] - actual[ok]
+        months = np.asarray(departures[ok], dtype='datetime64[s]').astype('datetime64[M]').astype(np.int64) % 12
+        dimensions['total'].update(np.full(len(errors), 'total', dtype=object), errors)
+        dimensions['route'].update(normalize_codes(chunk['origin'])[ok] + '-' +
+                                   normalize_codes(chunk['destination'])[ok], errors)
+        dimensions['aircraft_type'].update(aircraft_types[ok], errors)
+        dimensions['season'].update(SEASONS[months], errors)
+        print(f"🧮 {total} vuelos procesados")
+
+    report = pd.concat([accumulator.summary(name, 1 if name == 'total' else min_count)
+                        for name, accumulator in dimensions.items()], ignore_index=True)
+    if output:
+        report.to_csv(output, index=False)
+
+    evaluated = int(dimensions['total'].count.sum())
+    summary = ', '.join(f'{status}: {count}' for status, count in sorted(skipped.items())) or 'ninguno'
+    print(f"📊 Evaluados {evaluated} de {total} vuelos en {time.perf_counter() - started:.1f} s "
+          f"(descartados: {summary})")
+    with pd.option_context('display.max_rows', 60, 'display.width', 160):
+        for name in dimensions:
+            print(f"\n— {name} —")
+            print(report[report['dimension'] == name].drop(columns='dimension').head(15).to_string(index=False))
+    if output:
+        print(f"\n✅ Informe completo en {output}")
+
+
+@app.cli.command('benchmark-index')
+def benchmark_index():
+    """Micro-benchmark: índice IATA frente a la búsqueda con máscara booleana en el DataFrame"""
+    import timeit
+
+    airports = airport_data.load_now()
+    airports_df = airports.df
+    codes = list(airports.by_iata)
+    iterations = 2000
+
+    def lookup_mask():
+        for code in codes:
+            airports_df[airports_df['iata_code'] == code].iloc[0]
+
+    def lookup_index():
+        for code in codes:
+            airports.find_airport(code)
+
+    mask_time = min(timeit.repeat(lookup_mask, number=max(1, iterations // len(codes)), repeat=3))
+    index_time = min(timeit.repeat(lookup_index, number=max(1, iterations // len(codes)), repeat=3))
+    lookups = max(1, iterations // len(codes)) * len(codes)
+
+    print(f"📊 Aeropuertos: {len(airports_df)} | Búsquedas: {lookups}")
+    print(f"🐢 Máscara booleana + iloc: {mask_time / lookups * 1e6:.2f} µs/búsqueda")
+    print(f"🚀 Índice IATA (dict):      {index_time / lookups * 1e6:.2f} µs/búsqueda")
+    print(f"⚡ Aceleración: x{mask_time / index_time:.0f}")
+
+
+def should_start_background_tasks():
+    """Evita arrancar hilos en el proceso padre del recargador de Flask en modo debug"""
+    return __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+
+if WEATHER_PREFETCH_ENABLED and should_start_background_tasks():
+    weather_prefetcher.start()
+
+if WEATHER_GRID_ENABLED and should_start_background_tasks():
+    weather_grid.start()
+
+
 if __name__ == '__main__':
     print("🚀 European Flight Duration Predictor")
     print("=====================================")
-    print(f"📊 Aeropuertos cargados: {len(airports_df)}")
-    print(f"🌍 Países: {airports_df['iso_country'].nunique()}")
+    print(f"📊 Aeropuertos: carga {'en segundo plano' if AIRPORTS_LOAD_MODE == 'background' else 'síncrona'}")
     print(f"🌐 Servidor: http://localhost:5000")
     print("=====================================")
 
@@ -1009,7 +3975,7 @@ La aplicación sigue una arquitectura cliente-servidor simple, donde Flask actú
 El backend de Flask (`app.py`) expone varios puntos finales (endpoints) API:
 
 * `@app.route('/')`: Sirve la página principal que contiene toda la lógica del frontend (el `HTML_TEMPLATE`).
-* `@app.route('/api/airports')`: Devuelve un objeto JSON con la lista de los 50 aeropuertos europeos, obtenidos por la función `download_airport_data()` usando `pandas`.
+* `@app.route('/api/airports')`: Devuelve un objeto JSON con la lista de los 50 aeropuertos europeos, obtenidos por la función `load_airport_data()` usando `pandas`.
 * `@app.route('/api/weather/<iata_code>')`: (Endpoint inferido por el JS) Obtiene y devuelve el clima actual (temperatura, viento) para el aeropuerto con el código IATA especificado.
 * `@app.route('/api/calculate')`: (Endpoint inferido por el JS) Recibe el origen y el destino. Llama internamente a la API del clima, calcula la distancia Haversine y aplica una fórmula (que incluye el viento y la temperatura) para estimar la duración del vuelo.
 
@@ -1019,7 +3985,7 @@ El backend de Flask (`app.py`) expone varios puntos finales (endpoints) API:
 
 1.  **OurAirports (Datos de Aeropuertos):**
     * **Endpoint:** `https://raw.githubusercontent.com/davidmegginson/ourairports-data/main/airports.csv`
-    * **Uso:** La función `download_airport_data()` descarga este archivo CSV público, lo filtra con `pandas` para encontrar aeropuertos europeos principales y crea la lista de 50 aeropuertos utilizada por la aplicación.
+    * **Uso:** La función `load_airport_data()` descarga este archivo CSV público (o reutiliza la copia en caché si no ha cambiado), lo lee por bloques con `pandas` para encontrar aeropuertos europeos principales y crea la lista de 50 aeropuertos utilizada por la aplicación.
 
 2.  **Open-Meteo API (Clima):**
     * **Uso:** (Como se menciona en el HTML del proyecto) Esta API se utiliza para obtener los datos meteorológicos en tiempo real (temperatura y velocidad del viento) para las coordenadas geográficas de los aeropuertos seleccionados.